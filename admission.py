@@ -0,0 +1,315 @@
+import os
+import math
+import time
+import random
+import asyncio
+import logging
+from collections import deque
+from contextlib import contextmanager, asynccontextmanager
+from contextvars import ContextVar
+
+from metrics import Counter, Histogram, count, observe, render_samples
+
+logger = logging.getLogger(__name__)
+
+# Bound the work admitted per stage and give every request a deadline.
+# Requests that would wait beyond the queue bounds are rejected at once (429)
+# and requests that run out of time are abandoned (503), both with Retry-After.
+ADMISSION_CONTROL = os.getenv("ADMISSION_CONTROL", "true").lower() in ("1", "true", "yes")
+# Per-request time budget across all stages; 0 disables deadlines
+REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", "30"))
+# Query embedding and retrieval (CPU-bound) running / waiting at most
+EMBED_MAX_CONCURRENCY = int(os.getenv("EMBED_MAX_CONCURRENCY", "4"))
+EMBED_QUEUE_SIZE = int(os.getenv("EMBED_QUEUE_SIZE", "32"))
+# LLM calls in flight / waiting at most, across all requests (provider rate limits)
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+LLM_QUEUE_SIZE = int(os.getenv("LLM_QUEUE_SIZE", "64"))
+# Seconds a streamed answer may wait for its first token (within the deadline); 0 disables
+LLM_FIRST_TOKEN_SECONDS = float(os.getenv("LLM_FIRST_TOKEN_SECONDS", "10"))
+# Index builds and refreshes of uncached ASINs in flight / waiting at most
+INDEX_BUILD_MAX_CONCURRENCY = int(os.getenv("INDEX_BUILD_MAX_CONCURRENCY", "4"))
+INDEX_BUILD_QUEUE_SIZE = int(os.getenv("INDEX_BUILD_QUEUE_SIZE", "16"))
+# Retries of LLM calls the provider throttled (HTTP 429), with full-jitter exponential backoff
+LLM_RETRY_ATTEMPTS = int(os.getenv("LLM_RETRY_ATTEMPTS", "3"))
+LLM_RETRY_BASE_SECONDS = float(os.getenv("LLM_RETRY_BASE_SECONDS", "0.5"))
+LLM_RETRY_MAX_SECONDS = float(os.getenv("LLM_RETRY_MAX_SECONDS", "8"))
+
+QUEUE_WAIT_SECONDS = Histogram("chatbot_queue_wait_seconds", "Time waited for a stage slot.")
+ADMISSION_REJECTIONS = Counter("chatbot_admission_rejections_total",
+                               "Requests rejected by stage and reason (queue_full, deadline).")
+LLM_RETRIES = Counter("chatbot_llm_retries_total", "LLM calls retried after provider throttling.")
+
+
+class AdmissionError(Exception):
+    """
+    A request the service will not (or no longer) serve; ``retry_after`` is
+    the suggested wait in seconds before trying again.
+    """
+
+    status_code = 503
+
+    def __init__(self, message: str, stage: str, retry_after: int = 1):
+        super().__init__(message)
+        self.stage = stage
+        self.retry_after = max(1, int(retry_after))
+
+
+class Overloaded(AdmissionError):
+    """
+    The stage's queue is full.
+    """
+
+    status_code = 429
+
+
+class DeadlineExceeded(AdmissionError):
+    """
+    The request's deadline passed (or would pass) before the stage finished.
+    """
+
+    status_code = 503
+
+
+_deadline = ContextVar("request_deadline", default=None)
+
+
+@contextmanager
+def request_deadline(seconds: float = None):
+    """
+    Gives everything run in this context (including executor work started
+    with a copied context) a deadline ``seconds`` from now.
+    """
+    seconds = REQUEST_DEADLINE_SECONDS if seconds is None else seconds
+    deadline = time.monotonic() + seconds if ADMISSION_CONTROL and seconds > 0 else None
+    token = _deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining():
+    """
+    Seconds left until the current request's deadline, or None without one.
+    """
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def _deadline_exceeded(stage: str) -> DeadlineExceeded:
+    count(ADMISSION_REJECTIONS, stage=stage, reason="deadline")
+    return DeadlineExceeded(f"Request deadline exceeded during {stage}", stage)
+
+
+def check_deadline(stage: str):
+    left = remaining()
+    if left is not None and left <= 0:
+        raise _deadline_exceeded(stage)
+
+
+async def within_deadline(awaitable, stage: str, timeout: float = None):
+    """
+    Awaits ``awaitable``, giving up with DeadlineExceeded when the request's
+    deadline (or ``timeout`` seconds, if sooner) passes first. Shielded work
+    (e.g. a coalesced index build) keeps running for its other callers.
+    """
+    left = remaining()
+    if timeout is not None and ADMISSION_CONTROL:
+        left = timeout if left is None else min(left, timeout)
+    if left is None:
+        return await awaitable
+    if left <= 0:
+        if asyncio.iscoroutine(awaitable):
+            awaitable.close()
+        raise _deadline_exceeded(stage)
+    try:
+        return await asyncio.wait_for(awaitable, left)
+    except asyncio.TimeoutError:
+        raise _deadline_exceeded(stage) from None
+
+
+class StageQueue:
+    """
+    Admission for one pipeline stage: at most ``max_concurrency`` callers hold
+    a slot and at most ``max_queue`` wait for one, first come first served.
+    A caller arriving at a full queue is rejected at once with Overloaded; a
+    waiting caller gives up with DeadlineExceeded when its deadline passes.
+
+    Used from the event loop only, so no locking is needed.
+    """
+
+    def __init__(self, name: str, max_concurrency: int, max_queue: int):
+        self.name = name
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.max_queue = max(0, int(max_queue))
+        self.in_flight = 0
+        self._waiters = deque()
+        # Moving average of how long a slot is held, for Retry-After estimates
+        self._avg_hold_seconds = 0.0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.wait_seconds_total = 0.0
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def saturated(self) -> bool:
+        return self.in_flight >= self.max_concurrency and self.queued >= self.max_queue
+
+    def retry_after(self) -> int:
+        """
+        Rough seconds until a newly queued caller would get a slot.
+        """
+        return math.ceil(self._avg_hold_seconds * (self.queued + 1) / self.max_concurrency) or 1
+
+    def reject_if_saturated(self):
+        if self.saturated():
+            self.rejected += 1
+            count(ADMISSION_REJECTIONS, stage=self.name, reason="queue_full")
+            raise Overloaded(f"Too many requests waiting for {self.name}", self.name, self.retry_after())
+
+    async def _acquire(self) -> float:
+        if self.in_flight < self.max_concurrency and not self._waiters:
+            self.in_flight += 1
+            return 0.0
+        self.reject_if_saturated()
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        start = time.perf_counter()
+        try:
+            await within_deadline(future, self.name)
+        except BaseException as e:
+            if future in self._waiters:
+                self._waiters.remove(future)
+            elif future.done() and not future.cancelled():
+                # A slot was handed over just as we gave up; pass it on
+                self._release()
+            if isinstance(e, DeadlineExceeded):
+                self.timed_out += 1
+            raise
+        return time.perf_counter() - start
+
+    def _release(self):
+        while self._waiters:
+            future = self._waiters.popleft()
+            if not future.done():
+                # The slot goes straight to the next waiter; in_flight is unchanged
+                future.set_result(None)
+                return
+        self.in_flight -= 1
+
+    @asynccontextmanager
+    async def slot(self):
+        """
+        ``async with queue.slot(): ...`` runs the block holding one of the
+        stage's slots. A no-op with ADMISSION_CONTROL disabled.
+        """
+        if not ADMISSION_CONTROL:
+            yield
+            return
+        waited = await self._acquire()
+        self.admitted += 1
+        self.wait_seconds_total += waited
+        observe(QUEUE_WAIT_SECONDS, waited, stage=self.name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._avg_hold_seconds = 0.9 * self._avg_hold_seconds + 0.1 * (time.perf_counter() - start)
+            self._release()
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "avg_wait_seconds": self.wait_seconds_total / self.admitted if self.admitted else 0.0,
+        }
+
+
+embedding_queue = StageQueue("embedding", EMBED_MAX_CONCURRENCY, EMBED_QUEUE_SIZE)
+llm_queue = StageQueue("llm", LLM_MAX_CONCURRENCY, LLM_QUEUE_SIZE)
+# Taken by the one request that starts a build; requests joining it wait without a slot
+index_build_queue = StageQueue("index_build", INDEX_BUILD_MAX_CONCURRENCY, INDEX_BUILD_QUEUE_SIZE)
+stage_queues = [embedding_queue, llm_queue, index_build_queue]
+
+
+def admit():
+    """
+    Rejects a new request up front (Overloaded) when any stage it needs is
+    already saturated, before it does any work. Index builds are admitted
+    when they start, since most requests are served from a cached index.
+    """
+    if ADMISSION_CONTROL:
+        for queue in (embedding_queue, llm_queue):
+            queue.reject_if_saturated()
+
+
+def is_throttling_error(error: Exception) -> bool:
+    """
+    True for provider rate-limit errors (HTTP 429 / *RateLimit* exceptions).
+    """
+    if isinstance(error, AdmissionError):
+        return False
+    response = getattr(error, "response", None)
+    status = getattr(error, "status_code", None) or getattr(response, "status_code", None)
+    return status == 429 or "ratelimit" in type(error).__name__.lower()
+
+
+def _provider_retry_after(error: Exception):
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    try:
+        return float(headers.get("retry-after")) if headers is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+async def call_llm(make_call):
+    """
+    Awaits ``make_call()`` (a coroutine factory, e.g. an LLM ainvoke) holding
+    an LLM slot and within the request deadline. Throttled calls are retried
+    up to LLM_RETRY_ATTEMPTS times after the provider's Retry-After or a
+    full-jitter exponential backoff, with the slot released while waiting.
+    """
+    attempt = 0
+    while True:
+        try:
+            async with llm_queue.slot():
+                return await within_deadline(make_call(), "llm")
+        except Exception as e:
+            if not is_throttling_error(e) or attempt >= LLM_RETRY_ATTEMPTS:
+                raise
+            delay = _provider_retry_after(e)
+            if delay is None:
+                delay = random.uniform(0, min(LLM_RETRY_MAX_SECONDS, LLM_RETRY_BASE_SECONDS * 2 ** attempt))
+            left = remaining()
+            if left is not None and delay >= left:
+                raise _deadline_exceeded("llm") from e
+            attempt += 1
+            count(LLM_RETRIES)
+            logger.warning(f"LLM call throttled; retry {attempt}/{LLM_RETRY_ATTEMPTS} in {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+
+def stats() -> dict:
+    return {"enabled": ADMISSION_CONTROL, "deadline_seconds": REQUEST_DEADLINE_SECONDS,
+            "stages": {queue.name: queue.stats() for queue in stage_queues}}
+
+
+def render_metrics() -> list:
+    """
+    Prometheus text-format lines for queue depth, wait time, rejections and retries.
+    """
+    lines = render_samples("chatbot_stage_queue_depth", "gauge", "Callers waiting for a stage slot.",
+                           [({"stage": queue.name}, queue.queued) for queue in stage_queues])
+    lines += render_samples("chatbot_stage_in_flight", "gauge", "Callers holding a stage slot.",
+                            [({"stage": queue.name}, queue.in_flight) for queue in stage_queues])
+    lines += QUEUE_WAIT_SECONDS.render() + ADMISSION_REJECTIONS.render() + LLM_RETRIES.render()
+    return lines
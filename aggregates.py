@@ -0,0 +1,125 @@
+import re
+import logging
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Ordered: the first matching intent wins, so the more specific patterns come first
+INTENT_PATTERNS = [
+    ("rating_trend", re.compile(r"\b(rating|ratings|stars?|reviews?)\b.*\b(trend|over time|by month|monthly|per month)\b"
+                                r"|\b(trend|over time|by month|monthly|per month)\b.*\b(rating|ratings|stars?|reviews?)\b")),
+    ("rating_distribution", re.compile(r"\b(rating|ratings|stars?)\b.*\b(distribution|breakdown|histogram|split)\b"
+                                       r"|\bhow many (\d|one|two|three|four|five)[- ]stars?\b")),
+    # Totals only; "the reviews with the most helpful votes" needs the reviews themselves
+    ("helpful_votes", re.compile(r"\b(how many|number of|total|count of)\b.*\bhelpful\b.*\bvotes?\b"
+                                 r"|\bhelpful votes?\b.*\b(total|count)\b")),
+    ("average_rating", re.compile(r"\b(average|mean)\b.*\b(rating|stars?|score)\b"
+                                  r"|\boverall (star )?(rating|score)\b|\bwhat('s| is) (my|the) rating\b")),
+    # Only count / share questions; "what do verified buyers say ..." needs the reviews themselves
+    ("verified_share", re.compile(r"(\b(how many|number of|share of|percent(age)?|proportion|fraction)\b|%).*\bverified\b"
+                                  r"|\bverified\b.*(\bpercent(age)?\b|%)"
+                                  r"|\bverified (purchase |buyer |review )?(share|count|ratio)\b")),
+    ("review_count", re.compile(r"\bhow many reviews\b|\bnumber of reviews\b|\breview count\b|\btotal reviews\b")),
+]
+
+# Questions about what reviews say ("how many reviews mention shipping?",
+# "why do customers give low ratings?") need retrieval, whatever statistic they name
+CONTENT_QUALIFIERS = re.compile(r"\b(mention(s|ed|ing)?|complain(s|ed|ing|ts?)?|say(s|ing)?|said|talk(s|ed|ing)?"
+                                r"|discuss(es|ed|ing)?|describ(e|es|ed|ing)|about|why|reasons?|explain(s|ed)?"
+                                r"|summari[sz](e|es|ed|ing|y)|contain(s|ed|ing)?|prais(e|es|ed|ing)|think|feel)\b")
+
+
+def detect_intent(question: str):
+    """
+    Returns the aggregate intent a question asks for, or None when the
+    question needs retrieval and the LLM.
+    """
+    text = question.lower()
+    if CONTENT_QUALIFIERS.search(text):
+        return None
+    for intent, pattern in INTENT_PATTERNS:
+        if pattern.search(text):
+            return intent
+    return None
+
+
+def _to_datetime(timestamps: pd.Series) -> pd.Series:
+    if pd.api.types.is_numeric_dtype(timestamps):
+        # Review timestamps are epoch milliseconds
+        return pd.to_datetime(timestamps.astype("float64"), unit="ms", errors="coerce")
+    return pd.to_datetime(timestamps, errors="coerce")
+
+
+def compute_aggregates(review_df: pd.DataFrame) -> dict:
+    """
+    Vectorized statistics over every review of an ASIN (not just the ones a
+    retriever would return). The result is small and cached per ASIN.
+    """
+    aggregates = {"review_count": int(len(review_df))}
+
+    if "rating" in review_df.columns:
+        ratings = pd.to_numeric(review_df["rating"], errors="coerce").astype("float64").to_numpy()
+        ratings = ratings[~np.isnan(ratings)]
+        stars = np.clip(np.rint(ratings).astype(np.int64), 1, 5)
+        histogram = np.bincount(stars, minlength=6)[1:6]
+        aggregates["average_rating"] = float(ratings.mean()) if ratings.size else None
+        aggregates["rating_histogram"] = {star: int(count) for star, count in zip(range(1, 6), histogram)}
+
+    if "helpful_vote" in review_df.columns:
+        votes = pd.to_numeric(review_df["helpful_vote"], errors="coerce").fillna(0).astype("int64").to_numpy()
+        aggregates["helpful_votes_total"] = int(votes.sum())
+        aggregates["reviews_with_helpful_votes"] = int(np.count_nonzero(votes))
+
+    if "verified_purchase" in review_df.columns:
+        verified = review_df["verified_purchase"].astype("boolean").fillna(False).to_numpy(dtype=bool)
+        aggregates["verified_count"] = int(verified.sum())
+        aggregates["verified_share"] = float(verified.mean()) if verified.size else None
+
+    if "timestamp" in review_df.columns and "rating" in review_df.columns:
+        frame = pd.DataFrame({
+            "month": _to_datetime(review_df["timestamp"]).dt.to_period("M"),
+            "rating": pd.to_numeric(review_df["rating"], errors="coerce").astype("float64"),
+        }).dropna()
+        monthly = frame.groupby("month")["rating"].agg(["count", "mean"]).sort_index()
+        aggregates["monthly_trend"] = [
+            {"month": str(month), "reviews": int(row["count"]), "average_rating": round(float(row["mean"]), 2)}
+            for month, row in monthly.iterrows()
+        ]
+    return aggregates
+
+
+def _format_trend(trend, months: int = 12) -> str:
+    recent = trend[-months:]
+    lines = [f"- {item['month']}: {item['reviews']} reviews, average {item['average_rating']:.2f}" for item in recent]
+    return "\n".join(lines)
+
+
+def answer_aggregate(intent: str, aggregates: dict):
+    """
+    Phrases the answer for an aggregate intent without calling the LLM.
+    Returns None when the data needed for the intent is missing.
+    """
+    count = aggregates.get("review_count", 0)
+    if intent == "review_count":
+        return f"This product has {count} reviews."
+    if intent == "helpful_votes" and "helpful_votes_total" in aggregates:
+        total = aggregates["helpful_votes_total"]
+        if total == 0:
+            return f"There are no helpful votes across the {count} reviews."
+        return (f"There are {total} helpful votes in total, spread over "
+                f"{aggregates['reviews_with_helpful_votes']} of the {count} reviews.")
+    if intent == "average_rating" and aggregates.get("average_rating") is not None:
+        return f"The average rating is {aggregates['average_rating']:.2f} out of 5 across {count} reviews."
+    if intent == "rating_distribution" and "rating_histogram" in aggregates:
+        histogram = aggregates["rating_histogram"]
+        lines = [f"- {star} star: {histogram[star]} ({histogram[star] / count:.0%})" for star in range(5, 0, -1)]
+        return f"Rating breakdown across {count} reviews:\n" + "\n".join(lines)
+    if intent == "verified_share" and aggregates.get("verified_share") is not None:
+        return (f"{aggregates['verified_count']} of {count} reviews "
+                f"({aggregates['verified_share']:.0%}) are from verified purchases.")
+    if intent == "rating_trend" and aggregates.get("monthly_trend"):
+        return "Reviews and average rating by month (most recent 12 months with reviews):\n" + \
+            _format_trend(aggregates["monthly_trend"])
+    return None
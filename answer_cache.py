@@ -0,0 +1,133 @@
+import os
+import threading
+import logging
+
+import numpy as np
+
+from cache import LRUTTLCache
+
+logger = logging.getLogger(__name__)
+
+# Serve stored answers for questions similar to ones already answered for the same ASIN
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+# Cosine similarity a new question needs with a cached one to reuse its answer
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.92"))
+ANSWER_CACHE_MAX_ASINS = int(os.getenv("ANSWER_CACHE_MAX_ASINS", "1024"))
+ANSWER_CACHE_MAX_PER_ASIN = int(os.getenv("ANSWER_CACHE_MAX_PER_ASIN", "256"))
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600"))
+
+
+def _normalize(vector) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+    norm = float(np.linalg.norm(vector))
+    return vector / norm if norm > 0 else vector
+
+
+class _AsinAnswers:
+    """
+    Cached answers of one ASIN, valid for one index version: a matrix of
+    unit-length question vectors (the small per-ASIN vector index) and the
+    matching answers, oldest first.
+    """
+
+    def __init__(self, max_entries: int, version=None):
+        self.max_entries = max_entries
+        self.version = version
+        self.vectors = None
+        self.entries = []
+        self.lock = threading.Lock()
+
+    def search(self, vector: np.ndarray):
+        with self.lock:
+            if not self.entries:
+                return None, 0.0
+            similarities = self.vectors @ vector
+            best = int(np.argmax(similarities))
+            return self.entries[best], float(similarities[best])
+
+    def add(self, vector: np.ndarray, entry: dict):
+        with self.lock:
+            if self.vectors is None or self.vectors.shape[1] != vector.shape[0]:
+                self.vectors = np.empty((0, vector.shape[0]), dtype=np.float32)
+                self.entries = []
+            self.vectors = np.vstack([self.vectors, vector[None, :]])[-self.max_entries:]
+            self.entries = (self.entries + [entry])[-self.max_entries:]
+
+    def __len__(self):
+        with self.lock:
+            return len(self.entries)
+
+
+class SemanticAnswerCache:
+    """
+    Answer cache keyed on (ASIN, question embedding).
+
+    A question whose embedding has at least ``threshold`` cosine similarity
+    with a question already answered for the same ASIN gets the stored answer
+    and sources, without retrieval or an LLM call. Each ASIN holds at most
+    ``max_entries_per_asin`` answers (oldest dropped first) and at most
+    ``max_asins`` ASINs are kept (least recently used dropped first).
+    Answers are tagged with the index version they were generated from and
+    dropped when it changes; call invalidate() for changes that keep the
+    version (in-memory refreshes).
+    """
+
+    def __init__(self, threshold: float = ANSWER_CACHE_SIMILARITY, max_asins: int = ANSWER_CACHE_MAX_ASINS,
+                 max_entries_per_asin: int = ANSWER_CACHE_MAX_PER_ASIN,
+                 ttl_seconds: float = ANSWER_CACHE_TTL_SECONDS):
+        self.threshold = threshold
+        self.max_entries_per_asin = max(1, int(max_entries_per_asin))
+        self._asins = LRUTTLCache(max_entries=max_asins, ttl_seconds=ttl_seconds, name="answers")
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def lookup(self, asin: str, question_vector, version=None):
+        """
+        Returns the cached entry (question, answer, sources, similarity) for
+        the most similar earlier question, or None below the threshold.
+        ``version`` is the ASIN's current index version; answers cached for
+        another version are dropped.
+        """
+        bucket = self._asins.get(asin)
+        if bucket is not None and bucket.version != version:
+            self.invalidate(asin)
+            bucket = None
+        entry, similarity = bucket.search(_normalize(question_vector)) if bucket is not None else (None, 0.0)
+        with self._lock:
+            if entry is None or similarity < self.threshold:
+                self.misses += 1
+                return None
+            self.hits += 1
+        logger.info(f"Answer cache hit for ASIN {asin} (similarity {similarity:.3f})")
+        return {**entry, "similarity": similarity}
+
+    def store(self, asin: str, question_vector, question: str, answer: str, sources=(), version=None):
+        bucket = self._asins.get(asin)
+        if bucket is None or bucket.version != version:
+            bucket = _AsinAnswers(self.max_entries_per_asin, version)
+            self._asins.put(asin, bucket)
+        bucket.add(_normalize(question_vector), {"question": question, "answer": answer, "sources": list(sources)})
+
+    def invalidate(self, asin: str):
+        if self._asins.invalidate(asin):
+            with self._lock:
+                self.invalidations += 1
+
+    def clear(self):
+        self._asins.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            stats = {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "invalidations": self.invalidations,
+                "threshold": self.threshold,
+            }
+        stats["asins"] = len(self._asins)
+        stats["evictions"] = self._asins.stats()["evictions"]
+        return stats
@@ -0,0 +1,226 @@
+import os
+import copy
+import time
+import logging
+
+import pandas as pd
+
+from index_factory import build_faiss_index, copy_index
+from hybrid_retrieval import create_hybrid_retriever
+from metrics import span, count, REVIEWS_INDEXED
+
+logger = logging.getLogger(__name__)
+
+# Rebuild (and persist) an index once its in-memory delta plus tombstones
+# exceed this fraction of the persisted base; until then refreshes only touch the delta
+INDEX_COMPACT_FRACTION = float(os.getenv("INDEX_COMPACT_FRACTION", "0.2"))
+
+
+def dataframe_to_documents(review_df: pd.DataFrame) -> list:
+    """
+    Converts review rows into LangChain Documents (text as page_content, the
+    other columns as metadata), skipping rows without text.
+    """
+    from langchain_community.document_loaders import DataFrameLoader
+
+    if review_df.empty:
+        return []
+    review_docs = DataFrameLoader(review_df).load()
+    return [doc for doc in review_docs if isinstance(doc.page_content, str)]
+
+
+def _timestamp_max(docs, default):
+    timestamps = [doc.metadata.get("timestamp") for doc in docs]
+    timestamps = [int(ts) for ts in timestamps if ts is not None and ts is not pd.NA]
+    return max(timestamps + ([default] if default is not None else []), default=None)
+
+
+class AsinIndex:
+    """
+    FAISS vector store for one ASIN plus the bookkeeping needed to refresh it
+    incrementally: the review high-water mark (latest review timestamp) and
+    the set of indexed review ids.
+
+    The base store (``vectordb``, usually memory-mapped from the index store)
+    is never modified. Reviews added by refreshes go into a small in-memory
+    ``delta`` store searched alongside it, and removed reviews of the base
+    are tombstoned and filtered out at search time, so a refresh costs in
+    proportion to the change. Once the delta and tombstones outgrow
+    INDEX_COMPACT_FRACTION of the base, the index is rebuilt (compacted).
+    """
+
+    def __init__(self, asin: str, vectordb, high_water_mark=None, review_ids=(), tombstones=(),
+                 version: str = None, delta=None):
+        self.asin = asin
+        self.vectordb = vectordb
+        self.delta = delta
+        self.high_water_mark = high_water_mark
+        self.review_ids = set(review_ids)
+        self.tombstones = set(tombstones)
+        self.version = version
+        self.refreshed_at = time.monotonic()
+        self._retriever = None
+
+    @classmethod
+    def build(cls, asin: str, docs, embeddings, kind: str = None, quantization: str = None):
+        """
+        Builds a new index over ``docs``; review ids become the docstore ids.
+        The FAISS index type is chosen from the corpus size (see index_factory.py).
+        """
+        vectordb = _build_store(docs, embeddings, kind=kind, quantization=quantization)
+        count(REVIEWS_INDEXED, len(docs))
+        return cls(asin, vectordb, high_water_mark=_timestamp_max(docs, None),
+                   review_ids=[doc.metadata["review_id"] for doc in docs])
+
+    @classmethod
+    def from_state(cls, asin: str, vectordb, state: dict, version: str = None):
+        return cls(asin, vectordb, high_water_mark=state.get("high_water_mark"),
+                   review_ids=state.get("review_ids", ()), tombstones=state.get("tombstones", ()),
+                   version=version)
+
+    def state(self) -> dict:
+        """
+        Bookkeeping saved with the base store; only meaningful for an index
+        without a delta (a fresh build or a compaction).
+        """
+        return {"high_water_mark": self.high_water_mark, "review_ids": sorted(self.review_ids),
+                "tombstones": sorted(self.tombstones), "num_documents": len(self.review_ids)}
+
+    @property
+    def retriever(self):
+        """
+        Hybrid (vector + BM25, reranked) retriever over this index; see hybrid_retrieval.py.
+        """
+        if self._retriever is None:
+            search_filter = None
+            tombstones = frozenset(self.tombstones)
+            if tombstones:
+                search_filter = lambda metadata: metadata.get("review_id") not in tombstones
+            self._retriever = create_hybrid_retriever(self.vectordb, search_filter=search_filter,
+                                                      excluded_ids=tombstones, delta_store=self.delta)
+        return self._retriever
+
+    def is_stale(self, max_age_seconds: float) -> bool:
+        return bool(max_age_seconds) and time.monotonic() - self.refreshed_at > max_age_seconds
+
+    def _delta_ids(self) -> set:
+        return set(self.delta.index_to_docstore_id.values()) if self.delta is not None else set()
+
+    def needs_compaction(self) -> bool:
+        changed = len(self.tombstones) + len(self._delta_ids())
+        return changed > 0 and changed > INDEX_COMPACT_FRACTION * self.vectordb.index.ntotal
+
+    def refresh(self, source):
+        """
+        Brings the index up to date with ``source``: fetches only the keys of
+        all reviews plus the rows of reviews not indexed yet, embeds and adds
+        those, and removes (or tombstones) reviews that disappeared.
+
+        This index is left untouched, since other requests may be searching
+        it. The returned AsinIndex shares the base store and gets a new delta;
+        it is a compacted rebuild when the changes passed INDEX_COMPACT_FRACTION.
+        Returns None when nothing changed.
+        """
+        start = time.perf_counter()
+        self.refreshed_at = time.monotonic()
+        with span("fetch_review_keys"):
+            keys = source.fetch_review_keys(self.asin)
+        if keys.empty:
+            # An empty key list more likely means a failed read than a deleted
+            # product; keep serving the current index
+            logger.warning(f"No review keys returned for ASIN {self.asin}; skipping refresh")
+            return None
+
+        current_ids = set(keys["review_id"].tolist())
+        known_ids = self.review_ids | self.tombstones
+        removed_ids = self.review_ids - current_ids
+        added = keys[~keys["review_id"].isin(known_ids)]
+
+        new_docs = []
+        if not added.empty:
+            # Fetch from the oldest unseen review on, so late-arriving reviews
+            # with a timestamp below the high-water mark are not missed
+            since = int(added["timestamp"].min()) - 1
+            with span("fetch_reviews"):
+                delta_df = source.fetch_reviews(self.asin, since=since)
+            if not delta_df.empty:
+                delta_df = delta_df[delta_df["review_id"].isin(set(added["review_id"].tolist()))]
+            new_docs = dataframe_to_documents(delta_df)
+
+        if not new_docs and not removed_ids:
+            return None
+        with span("index_update"):
+            refreshed = self._with_changes(new_docs, removed_ids)
+        if refreshed.needs_compaction():
+            with span("index_compact"):
+                refreshed = refreshed.compact()
+        count(REVIEWS_INDEXED, len(new_docs))
+        logger.info(f"Refreshed index for ASIN {self.asin}: +{len(new_docs)} / -{len(removed_ids)} reviews "
+                    f"in {time.perf_counter() - start:.2f}s")
+        return refreshed
+
+    def _with_changes(self, new_docs, removed_ids) -> "AsinIndex":
+        # Only the delta is copied (and changed); the base store is shared
+        delta_ids = self._delta_ids()
+        removed_from_delta = removed_ids & delta_ids
+        delta = self.delta
+        if delta is not None and (new_docs or removed_from_delta):
+            from langchain_community.docstore.in_memory import InMemoryDocstore
+
+            delta = copy.copy(self.delta)
+            delta.index = copy_index(self.delta.index)
+            delta.docstore = InMemoryDocstore(dict(self.delta.docstore._dict))
+            delta.index_to_docstore_id = dict(self.delta.index_to_docstore_id)
+            if removed_from_delta:
+                delta.delete(list(removed_from_delta))
+            if new_docs:
+                delta.add_documents(new_docs, ids=[doc.metadata["review_id"] for doc in new_docs])
+            if not delta.index_to_docstore_id:
+                delta = None
+        elif delta is None and new_docs:
+            # Small and exact; compaction folds it into a base of the right type
+            delta = _build_store(new_docs, self.vectordb.embedding_function, kind="flat", quantization="none")
+
+        refreshed = AsinIndex(self.asin, self.vectordb,
+                              high_water_mark=_timestamp_max(new_docs, self.high_water_mark),
+                              review_ids=self.review_ids - removed_ids,
+                              tombstones=self.tombstones | (removed_ids - delta_ids),
+                              version=self.version, delta=delta)
+        refreshed.review_ids.update(doc.metadata["review_id"] for doc in new_docs)
+        return refreshed
+
+    def compact(self) -> "AsinIndex":
+        """
+        Rebuilds the index over its live reviews (base minus tombstones, plus
+        the delta), choosing the index type anew. Review vectors come from the
+        embedding cache, so this does not run the embedding model again.
+        """
+        docs = [self.vectordb.docstore.search(doc_id) for doc_id in self.vectordb.index_to_docstore_id.values()
+                if doc_id not in self.tombstones]
+        if self.delta is not None:
+            docs += [self.delta.docstore.search(doc_id) for doc_id in self.delta.index_to_docstore_id.values()]
+        logger.info(f"Compacting index for ASIN {self.asin}: {len(docs)} live reviews, "
+                    f"{len(self.tombstones)} tombstones")
+        vectordb = _build_store(docs, self.vectordb.embedding_function)
+        return AsinIndex(self.asin, vectordb, high_water_mark=self.high_water_mark,
+                         review_ids=[doc.metadata["review_id"] for doc in docs])
+
+
+def _build_store(docs, embeddings, kind: str = None, quantization: str = None):
+    """
+    LangChain FAISS store over ``docs`` with review ids as docstore ids.
+    """
+    import numpy as np
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+    from langchain_community.vectorstores import FAISS
+
+    ids = [doc.metadata["review_id"] for doc in docs]
+    texts = [doc.page_content for doc in docs]
+    with span("embed_documents"):
+        vectors = np.asarray(embeddings.embed_documents(texts), dtype=np.float32)
+    with span("index_build"):
+        index = build_faiss_index(vectors, kind=kind, quantization=quantization)
+        vectordb = FAISS(embedding_function=embeddings, index=index, docstore=InMemoryDocstore(),
+                         index_to_docstore_id={})
+        vectordb.add_embeddings(zip(texts, vectors.tolist()), metadatas=[doc.metadata for doc in docs], ids=ids)
+    return vectordb
@@ -0,0 +1,64 @@
+"""
+Deterministic chat model with configurable latency, standing in for the
+hosted LLM during benchmarks.
+"""
+import time
+import asyncio
+import hashlib
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+
+class FakeLatencyChatModel(BaseChatModel):
+    """
+    Answers every prompt with a fixed-length answer derived from a hash of
+    the prompt, after ``latency_seconds`` (time to first token) plus
+    ``seconds_per_token`` per generated token. The same prompt always gets
+    the same answer.
+    """
+
+    latency_seconds: float = 0.2
+    seconds_per_token: float = 0.0
+    answer_tokens: int = 40
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-latency-chat"
+
+    def _tokens(self, messages) -> list:
+        prompt = "".join(str(message.content) for message in messages)
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        return [f"w{digest[(4 * i) % 60:(4 * i) % 60 + 4]} " for i in range(self.answer_tokens)]
+
+    def _generation_seconds(self) -> float:
+        return self.latency_seconds + self.seconds_per_token * self.answer_tokens
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        time.sleep(self._generation_seconds())
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="".join(self._tokens(messages))))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        await asyncio.sleep(self._generation_seconds())
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="".join(self._tokens(messages))))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latency_seconds)
+        for token in self._tokens(messages):
+            if self.seconds_per_token:
+                time.sleep(self.seconds_per_token)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.latency_seconds)
+        for token in self._tokens(messages):
+            if self.seconds_per_token:
+                await asyncio.sleep(self.seconds_per_token)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                await run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
@@ -0,0 +1,258 @@
+"""
+Offline load test of the FastAPI app.
+
+Serves synthetic review corpora through an in-memory stand-in for the
+BigQuery data source, answers with a deterministic fake LLM of configurable
+latency, and drives main.app in-process with concurrent clients. For every
+corpus size it measures a cold phase (first question per ASIN: fetch, embed,
+index build) and a warm phase (cached indexes), and reports p50/p95/p99
+latency, requests per second and peak RSS, overall and per pipeline stage
+(from the /chat/ timing breakdown). Results are written as JSON so runs can
+be compared.
+
+Example:
+    python benchmarks/run_benchmark.py --corpus-sizes 100 1000 10000 --asins 4 \
+        --requests 200 --concurrency 16 --llm-latency 0.3 --out bench.json
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import logging
+import platform
+import resource
+import tempfile
+import threading
+from datetime import datetime, timezone
+
+import numpy as np
+
+# Allow importing shared modules from the repository root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+logger = logging.getLogger(__name__)
+
+# chatbot_model copies these into os.environ at import time, which fails when they are unset
+_PROVIDER_ENV_VARS = ["HF_TOKEN", "DEEPSEEK_API_KEY", "GROQ_API_KEY", "LANGFUSE_PUBLIC_KEY", "LANGFUSE_SECRET_KEY",
+                      "LANGFUSE_HOST", "GOOGLE_APPLICATION_CREDENTIALS"]
+PERCENTILES = (50, 95, 99)
+
+
+def _prepare_environment(work_dir: str):
+    """
+    Points the index store and embedding cache at a scratch directory so every
+    run starts cold, and fills in the provider variables the app expects.
+    Must run before the app modules are imported.
+    """
+    for name in _PROVIDER_ENV_VARS:
+        os.environ.setdefault(name, "")
+    os.environ["INDEX_STORE_DIR"] = os.path.join(work_dir, "indexes")
+    os.environ["EMBEDDING_CACHE_DIR"] = os.path.join(work_dir, "embeddings")
+    # Every benchmark question should reach retrieval and the LLM unless asked otherwise
+    os.environ.setdefault("ANSWER_CACHE_ENABLED", "false")
+    os.environ.setdefault("METRICS_ENABLED", "true")
+
+
+def _current_rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        # No /proc (macOS): fall back to the process-lifetime peak
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2**20 if sys.platform == "darwin" else peak / 1024
+
+
+class RssSampler:
+    """
+    Samples the resident set size in a background thread and keeps the peak.
+    """
+
+    def __init__(self, interval_seconds: float = 0.05):
+        self.interval_seconds = interval_seconds
+        self.start_mb = self.peak_mb = _current_rss_mb()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval_seconds):
+            self.peak_mb = max(self.peak_mb, _current_rss_mb())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stop.set()
+        self._thread.join()
+        self.peak_mb = max(self.peak_mb, _current_rss_mb())
+        return False
+
+
+def summarize_latencies(seconds) -> dict:
+    """
+    p50/p95/p99, mean and max of a list of durations, in milliseconds.
+    """
+    if not len(seconds):
+        return {}
+    ms = np.asarray(seconds, dtype=np.float64) * 1000
+    summary = {f"p{p}_ms": round(float(v), 2) for p, v in zip(PERCENTILES, np.percentile(ms, PERCENTILES))}
+    summary.update(mean_ms=round(float(ms.mean()), 2), max_ms=round(float(ms.max()), 2), count=int(len(ms)))
+    return summary
+
+
+async def drive(client, payloads, concurrency: int) -> dict:
+    """
+    Sends ``payloads`` to /chat/ from ``concurrency`` concurrent clients and
+    returns latency, throughput and per-stage statistics.
+    """
+    pending = iter(payloads)
+    latencies, errors, stages = [], 0, {}
+
+    async def client_loop():
+        nonlocal errors
+        # All clients pull from one iterator; safe because they share the event loop
+        for payload in pending:
+            start = time.perf_counter()
+            try:
+                response = await client.post("/chat/", json=payload)
+                body = response.json()
+            except Exception as e:
+                logger.warning(f"Request failed: {e}")
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+            # achatbot reports failures as an [error, []] answer with status 200
+            if response.status_code != 200 or isinstance(body.get("answer"), list):
+                errors += 1
+                continue
+            for stage, timing in body.get("timings", {}).get("stages", {}).items():
+                stages.setdefault(stage, []).append(timing["seconds"])
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client_loop() for _ in range(max(1, concurrency))))
+    elapsed = time.perf_counter() - start
+    return {
+        "requests": len(payloads),
+        "errors": errors,
+        "duration_seconds": round(elapsed, 3),
+        "requests_per_second": round(len(payloads) / elapsed, 2) if elapsed > 0 else None,
+        "latency": summarize_latencies(latencies),
+        "stages": {stage: summarize_latencies(values) for stage, values in sorted(stages.items())},
+    }
+
+
+def _reset_caches(chatbot_model):
+    chatbot_model.retriever_cache.clear()
+    chatbot_model.aggregate_cache.clear()
+    chatbot_model.answer_cache.clear()
+
+
+async def run_corpus(client, chatbot_model, corpus_size: int, args) -> list:
+    """
+    Cold and warm phases for one corpus size; returns one result per phase.
+    """
+    from synthetic import SyntheticDataSource, generate_questions
+
+    asins = [f"BENCH{corpus_size}X{i}" for i in range(args.asins)]
+    chatbot_model.data_source = SyntheticDataSource({asin: corpus_size for asin in asins},
+                                                    fetch_latency_seconds=args.fetch_latency, seed=args.seed)
+    _reset_caches(chatbot_model)
+    questions = generate_questions(args.asins + args.requests, seed=args.seed)
+
+    phases = [
+        ("cold", [{"asin": asin, "question": q, "include_timings": True} for asin, q in zip(asins, questions)]),
+        ("warm", [{"asin": asins[i % len(asins)], "question": q, "include_timings": True}
+                  for i, q in enumerate(questions[len(asins):])]),
+    ]
+    results = []
+    for phase, payloads in phases:
+        logger.info(f"Corpus {corpus_size} reviews/ASIN, {phase} phase: {len(payloads)} requests")
+        with RssSampler() as rss:
+            stats = await drive(client, payloads, args.concurrency)
+        results.append({"corpus_size": corpus_size, "asins": len(asins), "phase": phase, **stats,
+                        "rss_start_mb": round(rss.start_mb, 1), "peak_rss_mb": round(rss.peak_mb, 1)})
+    return results
+
+
+async def run_benchmark(args) -> dict:
+    import httpx
+    import main
+    import chatbot_model
+    from model_registry import registry
+    from fake_llm import FakeLatencyChatModel
+
+    embeddings = None
+    if args.fake_embeddings:
+        from langchain_core.embeddings import DeterministicFakeEmbedding
+        embeddings = DeterministicFakeEmbedding(size=args.fake_embedding_size)
+    registry.use_models(embeddings=embeddings,
+                        llm=FakeLatencyChatModel(latency_seconds=args.llm_latency,
+                                                 seconds_per_token=args.llm_token_latency))
+    # Load the (real) embedding model before timing anything
+    registry.embed_query("warm-up")
+
+    results = []
+    # ASGITransport calls the app in-process and skips the lifespan (no model warm-up)
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+        for corpus_size in args.corpus_sizes:
+            results += await run_corpus(client, chatbot_model, corpus_size, args)
+    return results
+
+
+def _print_summary(results):
+    print(f"{'corpus':>8} {'phase':>5} {'reqs':>5} {'err':>4} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} "
+          f"{'p99 ms':>9} {'peak MB':>8}")
+    for r in results:
+        latency = r["latency"]
+        print(f"{r['corpus_size']:>8} {r['phase']:>5} {r['requests']:>5} {r['errors']:>4} "
+              f"{r['requests_per_second'] or 0:>8.2f} {latency.get('p50_ms', 0):>9.1f} {latency.get('p95_ms', 0):>9.1f} "
+              f"{latency.get('p99_ms', 0):>9.1f} {r['peak_rss_mb']:>8.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline load test of the chatbot API with synthetic data.")
+    parser.add_argument("--corpus-sizes", type=int, nargs="+", default=[100, 1000, 10000],
+                        help="Reviews per ASIN; each size is benchmarked separately.")
+    parser.add_argument("--asins", type=int, default=4, help="ASINs per corpus size.")
+    parser.add_argument("--requests", type=int, default=200, help="Warm-phase requests per corpus size.")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent clients.")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Fake LLM time to first token (seconds).")
+    parser.add_argument("--llm-token-latency", type=float, default=0.0,
+                        help="Fake LLM time per generated token (seconds).")
+    parser.add_argument("--fetch-latency", type=float, default=0.0,
+                        help="Simulated BigQuery round trip per fetch (seconds).")
+    parser.add_argument("--fake-embeddings", action="store_true",
+                        help="Use deterministic fake embeddings instead of EMBEDDING_MODEL_NAME.")
+    parser.add_argument("--fake-embedding-size", type=int, default=384)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--work-dir", help="Scratch directory for indexes and caches (default: a temp dir).")
+    parser.add_argument("--out", default="benchmark_results.json", help="JSON report path.")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="chatbot_benchmark_")
+    _prepare_environment(work_dir)
+    # The app logs every request at INFO; keep the benchmark output readable
+    logging.getLogger().setLevel(logging.WARNING)
+    logger.setLevel(logging.INFO)
+
+    results = asyncio.run(run_benchmark(args))
+    report = {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "config": {name: value for name, value in vars(args).items() if name != "out"},
+        "environment": {"python": platform.python_version(), "platform": platform.platform(),
+                        "cpus": os.cpu_count(), "work_dir": work_dir},
+        "results": results,
+    }
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    _print_summary(results)
+    print(f"Report written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
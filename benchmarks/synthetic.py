@@ -0,0 +1,135 @@
+"""
+Synthetic review corpora and an in-memory stand-in for the BigQuery data
+source, so the service can be benchmarked without touching BigQuery.
+"""
+import time
+import zlib
+import threading
+
+import numpy as np
+import pandas as pd
+
+from data_sources import add_review_ids
+
+# Review sentences are assembled from these fragments so texts vary in length
+# and vocabulary like real reviews (and BM25 / embeddings have something to match)
+ASPECTS = ["battery", "screen", "sound", "size", "price", "shipping", "packaging", "color", "smell",
+           "texture", "instructions", "durability", "customer service", "fit", "weight"]
+OPINIONS = ["is excellent", "works as described", "broke after a week", "is better than expected",
+            "was disappointing", "feels cheap", "is worth the money", "arrived damaged", "is perfect",
+            "could be better", "stopped working", "exceeded my expectations"]
+FILLERS = ["I bought this for my daughter.", "Used it every day for a month.", "Would buy again.",
+           "Not sure I would recommend it.", "Compared it with two other brands.",
+           "The seller answered quickly.", "Took a while to get used to.", "Five stars from me."]
+CATEGORIES = ["All Beauty", "Electronics", "Home and Kitchen", "Sports and Outdoors"]
+
+QUESTION_TEMPLATES = ["How is the {aspect}?", "Do customers complain about the {aspect}?",
+                      "What do reviewers say about the {aspect}?", "Is the {aspect} good for the price?",
+                      "Any problems with the {aspect} after a few weeks?"]
+
+
+def _rng(*parts) -> np.random.Generator:
+    # zlib.crc32 is stable across processes, unlike hash()
+    return np.random.default_rng(zlib.crc32("|".join(map(str, parts)).encode("utf-8")))
+
+
+def generate_reviews(asin: str, num_reviews: int, seller_id: str = "BENCH_SELLER", seed: int = 0) -> pd.DataFrame:
+    """
+    Deterministic synthetic reviews for one ASIN, with the columns of
+    data_sources.REVIEW_COLUMNS.
+    """
+    rng = _rng(seed, asin)
+    rows = []
+    for i in range(num_reviews):
+        sentences = [f"The {rng.choice(ASPECTS)} {rng.choice(OPINIONS)}."
+                     for _ in range(int(rng.integers(1, 5)))]
+        sentences += list(rng.choice(FILLERS, size=int(rng.integers(0, 3)), replace=False))
+        rows.append({
+            "user_id": f"U{i:07d}",
+            "parent_asin": asin,
+            "asin": asin,
+            "text": " ".join(sentences),
+            "title": f"{rng.choice(OPINIONS).capitalize()}",
+            "rating": int(rng.integers(1, 6)),
+            "helpful_vote": int(rng.poisson(2)),
+            "verified_purchase": bool(rng.random() < 0.8),
+            "timestamp": 1_600_000_000_000 + i * 60_000,
+            "Category": CATEGORIES[zlib.crc32(asin.encode("utf-8")) % len(CATEGORIES)],
+            "seller_id": seller_id,
+        })
+    return add_review_ids(pd.DataFrame(rows)).drop(columns=["user_id"])
+
+
+def generate_metadata(asin: str, num_reviews: int, seller_id: str = "BENCH_SELLER") -> pd.DataFrame:
+    return pd.DataFrame([{
+        "parent_asin": asin, "title": f"Benchmark product {asin}", "main_category": "All Beauty",
+        "average_rating": 3.0, "rating_number": num_reviews, "features": [], "description": [],
+        "price": 19.99, "store": seller_id, "categories": [], "details": "{}",
+    }])
+
+
+def generate_questions(num_questions: int, seed: int = 0) -> list:
+    """
+    Review questions for the load test; every one goes through retrieval and the LLM.
+    """
+    rng = _rng(seed, "questions")
+    return [str(rng.choice(QUESTION_TEMPLATES)).format(aspect=rng.choice(ASPECTS)) + f" (#{i})"
+            for i in range(num_questions)]
+
+
+class SyntheticDataSource:
+    """
+    Drop-in replacement for data_sources.BigQuerySource serving generated
+    corpora from memory. ``fetch_latency_seconds`` is added to every call to
+    stand in for the BigQuery round trip.
+
+    Args:
+        corpora (dict): ASIN -> number of reviews.
+        fetch_latency_seconds (float): Simulated query latency.
+    """
+
+    def __init__(self, corpora: dict, fetch_latency_seconds: float = 0.0, seller_id: str = "BENCH_SELLER",
+                 seed: int = 0):
+        self.fetch_latency_seconds = fetch_latency_seconds
+        self.seller_id = seller_id
+        self.calls = 0
+        self._lock = threading.Lock()
+        # Generated up front so generation time never shows up in the measured fetches
+        self._reviews = {asin: generate_reviews(asin, n, seller_id, seed) for asin, n in corpora.items()}
+        self._metadata = {asin: generate_metadata(asin, n, seller_id) for asin, n in corpora.items()}
+
+    def _wait(self):
+        with self._lock:
+            self.calls += 1
+        if self.fetch_latency_seconds > 0:
+            time.sleep(self.fetch_latency_seconds)
+
+    def fetch_reviews(self, asin: str, since: int = None) -> pd.DataFrame:
+        self._wait()
+        review_df = self._reviews.get(asin)
+        if review_df is None:
+            return pd.DataFrame()
+        if since is not None:
+            review_df = review_df[review_df["timestamp"] > since]
+        return review_df.copy()
+
+    def fetch_review_keys(self, asin: str) -> pd.DataFrame:
+        self._wait()
+        review_df = self._reviews.get(asin)
+        if review_df is None:
+            return pd.DataFrame(columns=["review_id", "timestamp"])
+        return review_df[["review_id", "timestamp"]].copy()
+
+    def fetch_seller_asins(self, seller_id: str) -> list:
+        self._wait()
+        if seller_id != self.seller_id:
+            return []
+        return sorted(self._reviews, key=lambda asin: -len(self._reviews[asin]))
+
+    def fetch_metadata(self, asin: str) -> pd.DataFrame:
+        self._wait()
+        meta_df = self._metadata.get(asin)
+        return meta_df.copy() if meta_df is not None else pd.DataFrame()
+
+    def fetch_all(self, asin: str):
+        return self.fetch_reviews(asin), self.fetch_metadata(asin)
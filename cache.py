@@ -0,0 +1,113 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUTTLCache:
+    """
+    Thread-safe in-process cache with LRU eviction and TTL-based staleness.
+
+    Args:
+        max_entries (int): Maximum number of entries kept before the least
+            recently used one is evicted.
+        ttl_seconds (float): Age after which an entry is considered stale and
+            dropped on lookup. ``None`` or ``0`` disables expiry.
+        name (str): Label used in the stats output.
+        refresh_on_access (bool): Restart an entry's TTL on every hit, so the
+            TTL measures idle time rather than age.
+    """
+
+    def __init__(self, max_entries: int = 32, ttl_seconds: float = None, name: str = "cache",
+                 refresh_on_access: bool = False):
+        self.max_entries = max(1, int(max_entries))
+        self.ttl_seconds = ttl_seconds or None
+        self.name = name
+        self.refresh_on_access = refresh_on_access
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _is_expired(self, created_at: float, now: float) -> bool:
+        return self.ttl_seconds is not None and now - created_at > self.ttl_seconds
+
+    def get(self, key):
+        """
+        Returns the cached value for ``key`` or ``None`` on a miss or expiry.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, created_at = entry
+            if self._is_expired(created_at, now):
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            if self.refresh_on_access:
+                self._entries[key] = (value, now)
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """
+        Stores ``value`` under ``key``, evicting least recently used entries
+        when the cache is full.
+        """
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_build(self, key, builder):
+        """
+        Returns the cached value for ``key``, calling ``builder()`` to create
+        and store it on a miss. ``None`` results are not cached.
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+        value = builder()
+        if value is not None:
+            self.put(key, value)
+        return value
+
+    def invalidate(self, key) -> bool:
+        with self._lock:
+            return self._entries.pop(key, None) is not None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def __contains__(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and not self._is_expired(entry[1], time.monotonic())
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "name": self.name,
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
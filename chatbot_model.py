@@ -1,29 +1,29 @@
 import os
+import time
+import asyncio
+import contextvars
 import pandas as pd
-from google.cloud import bigquery
-from io import BytesIO
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 import logging
 
+from cache import LRUTTLCache
+from single_flight import SingleFlight
+from model_registry import registry
+from index_store import FaissIndexStore
+from asin_index import AsinIndex, dataframe_to_documents
+from data_sources import create_data_source
+from session_store import SessionStore
+from aggregates import detect_intent, compute_aggregates, answer_aggregate
+from hybrid_retrieval import pack_documents, rerank_documents
+from answer_cache import SemanticAnswerCache, ANSWER_CACHE_ENABLED
+from metrics import span, count, observe, llm_callbacks, REVIEWS_FETCHED, FAST_PATH_ANSWERS
+from admission import (AdmissionError, embedding_queue, llm_queue, index_build_queue, within_deadline, call_llm,
+                       LLM_FIRST_TOKEN_SECONDS)
 
-
-# LangChain & vector store imports
-from langchain_community.document_loaders import DataFrameLoader
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
-from langchain.chains import RetrievalQA
-from langchain_community.chat_models import ChatOpenAI
-from langchain.memory import ConversationBufferMemory
-from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
-# # Instead of: import openai
-# from langfuse.openai import OpenAI
-# from langfuse.decorators import observe
-# from langfuse import Langfuse
-# import asyncio
-
-from langchain.prompts import PromptTemplate
-from langchain.chains import RetrievalQA
-from langchain.chains import ConversationalRetrievalChain
+# LangChain, BigQuery and torch are imported inside the functions that use them so
+# that `import main` (and container start) stays fast; the model registry loads them once.
 
 # Load environment variables from .env
 load_dotenv()
@@ -46,87 +46,301 @@ os.environ["TOKENIZERS_PARALLELISM"] = "false"
 # For example, if using a file mounted in your container:
 os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = os.getenv('GOOGLE_APPLICATION_CREDENTIALS')
 
-# ---------- BigQuery Data Fetching Functions ----------
+# Built indexes are cached per ASIN so repeated questions skip the fetch/embed/index build
+RETRIEVER_CACHE_SIZE = int(os.getenv("RETRIEVER_CACHE_SIZE", "32"))
+RETRIEVER_CACHE_TTL_SECONDS = float(os.getenv("RETRIEVER_CACHE_TTL_SECONDS", "3600"))
+# How often a cached index checks the data source for added or removed reviews
+INDEX_REFRESH_SECONDS = float(os.getenv("INDEX_REFRESH_SECONDS", "300"))
+retriever_cache = LRUTTLCache(max_entries=RETRIEVER_CACHE_SIZE, ttl_seconds=RETRIEVER_CACHE_TTL_SECONDS,
+                              name="retriever")
 
-def fetch_reviews(asin: str) -> pd.DataFrame:
-    """
-    Fetches product review data for a given ASIN from BigQuery.
-    Adjust the query and table names to match your BigQuery dataset.
+# Aggregate questions ("average rating?", "how many helpful votes?") are answered
+# from precomputed per-ASIN statistics over all reviews, without retrieval or the LLM.
+# They expire on the index refresh schedule, so aggregate-only traffic sees new reviews too.
+AGGREGATE_FAST_PATH = os.getenv("AGGREGATE_FAST_PATH", "true").lower() in ("1", "true", "yes")
+aggregate_cache = LRUTTLCache(max_entries=int(os.getenv("AGGREGATE_CACHE_SIZE", "1024")),
+                              ttl_seconds=min(INDEX_REFRESH_SECONDS or RETRIEVER_CACHE_TTL_SECONDS,
+                                              RETRIEVER_CACHE_TTL_SECONDS or INDEX_REFRESH_SECONDS),
+                              name="aggregates")
+
+# Per-ASIN FAISS indexes persisted on local disk and memory-mapped by every worker.
+# Set INDEX_STORE_DIR to an empty string to build indexes in memory only.
+INDEX_STORE_DIR = os.getenv("INDEX_STORE_DIR", os.path.join("/tmp", "chatbot_index_store"))
+index_store = FaissIndexStore(INDEX_STORE_DIR) if INDEX_STORE_DIR else None
+
+# Concurrent requests for the same ASIN share one fetch + index build (or
+# refresh) and one aggregate computation instead of each running their own
+index_flight = SingleFlight(name="index_build")
+aggregate_flight = SingleFlight(name="aggregates")
+
+# Answers to stateless questions, reused for later questions about the same ASIN
+# whose embedding is close enough (see answer_cache.py); dropped when the index changes
+answer_cache = SemanticAnswerCache()
+
+# Server-side conversation sessions keyed by (session_id, ASIN)
+session_store = SessionStore()
+
+# Bounded pool for index builds and refreshes (fetching and embedding reviews,
+# building FAISS indexes) so async callers never run them on the event loop
+CPU_EXECUTOR_WORKERS = int(os.getenv("CPU_EXECUTOR_WORKERS", "2"))
+cpu_executor = ThreadPoolExecutor(max_workers=CPU_EXECUTOR_WORKERS, thread_name_prefix="cpu")
+
+# Maximum LLM calls in flight for one /chat/batch request
+BATCH_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY", "8"))
+
+# Seller-level / multi-ASIN questions search every per-ASIN index as a shard.
+# Shard searches (and builds of uncached shards) run on their own pool, at most
+# MULTI_ASIN_FANOUT per request, so a seller with hundreds of ASINs can neither
+# take over the single-ASIN executor nor crowd out other multi-ASIN requests.
+SHARD_EXECUTOR_WORKERS = int(os.getenv("SHARD_EXECUTOR_WORKERS", "4"))
+shard_executor = ThreadPoolExecutor(max_workers=SHARD_EXECUTOR_WORKERS, thread_name_prefix="shard")
+MULTI_ASIN_FANOUT = int(os.getenv("MULTI_ASIN_FANOUT", "4"))
+# ASINs beyond this many (a seller's least-reviewed ones) are not searched
+MULTI_ASIN_MAX_SHARDS = int(os.getenv("MULTI_ASIN_MAX_SHARDS", "50"))
+# Candidates taken from each shard, and reviews kept after the global merge
+SHARD_TOP_K = int(os.getenv("SHARD_TOP_K", "5"))
+MULTI_ASIN_TOP_K = int(os.getenv("MULTI_ASIN_TOP_K", "10"))
+
+# ---------- Review Data Fetching Functions ----------
+
+# Shared data source selected by REVIEW_DATA_SOURCE: live BigQuery (one pooled
+# client, parameterized and column-projected queries) or a local Parquet
+# snapshot. Replace with BigQuerySource(client=...) to serve data from a fake.
+data_source = create_data_source()
+
+def fetch_reviews(asin: str, since: int = None) -> pd.DataFrame:
     """
-    client = bigquery.Client()
-    query = f"""
-    SELECT *
-    FROM `spheric-engine-451615-a8.Amazon_Reviews_original_dataset_v3.Amazon_dataset_V3`
-    WHERE parent_asin = '{asin}'
+    Fetches product review data for a given ASIN from the configured data source,
+    optionally only reviews newer than the ``since`` timestamp.
+    Table names and projected columns are configured in data_sources.py.
     """
-    try:
-        review_df = client.query(query).to_dataframe()
-        logger.info(f"Fetched {len(review_df)} review records for ASIN: {asin}")
-    except Exception as e:
-        logger.exception(f"Error fetching reviews for ASIN {asin}: {e}")
-        review_df = pd.DataFrame()
+    with span("fetch_reviews"):
+        review_df = data_source.fetch_reviews(asin, since=since)
+    observe(REVIEWS_FETCHED, len(review_df))
     return review_df
 
 def fetch_metadata(asin: str) -> pd.DataFrame:
     """
-    Fetches product metadata for a given ASIN from BigQuery.
-    Adjust the query and table names as necessary.
+    Fetches product metadata for a given ASIN from the configured data source.
     """
-    client = bigquery.Client()
-    query = f"""
-    SELECT *
-    FROM `spheric-engine-451615-a8.Amazon_Reviews_original_dataset_v4.meta_data`
-    WHERE parent_asin = '{asin}'
+    return data_source.fetch_metadata(asin)
+
+def fetch_review_data(asin: str):
     """
-    try:
-        meta_df = client.query(query).to_dataframe()
-        logger.info(f"Fetched {len(meta_df)} metadata records for ASIN: {asin}")
-    except Exception as e:
-        logger.exception(f"Error fetching metadata for ASIN {asin}: {e}")
-        meta_df = pd.DataFrame()
-    return meta_df
-# def handle_user_input(user_input):
-#     loop = asyncio.new_event_loop()
-#     asyncio.set_event_loop(loop)
-#     loop.run_until_complete(async_handle_user_input(user_input))
-
-# async def async_handle_user_input(user_input):
-#     answer = await qa_chain.ainvoke(user_input)
-#     return answer
+    Fetches reviews and metadata for an ASIN concurrently; returns (review_df, meta_df).
+    """
+    return data_source.fetch_all(asin)
+
+def fetch_seller_asins(seller_id: str) -> list:
+    """
+    Parent ASINs of a seller's products, most-reviewed first.
+    """
+    return data_source.fetch_seller_asins(seller_id)
+
+async def _run_on(executor, fn, *args):
+    """
+    Runs ``fn(*args)`` on ``executor`` with the caller's context, so stage
+    timings recorded in the worker thread reach the request's breakdown.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, contextvars.copy_context().run, fn, *args)
+
+async def _embedding_stage(fn, *args):
+    """
+    Runs query embedding / retrieval work on the CPU executor, admitted
+    through the embedding queue and bounded by the request deadline.
+    """
+    async with embedding_queue.slot():
+        return await within_deadline(_run_on(cpu_executor, fn, *args), "embedding")
+
+def embed_question(text: str):
+    with span("embed_query"):
+        return registry.embed_query(text)
 
 # ---------- Retriever Creation ----------
 
-def create_retriever_from_df(review_df: pd.DataFrame):
+def create_asin_index(review_df: pd.DataFrame, asin: str = None) -> AsinIndex:
     """
-    Converts the review DataFrame into a vector database retriever using FAISS.
+    Builds the FAISS index for a review DataFrame. When the index store is
+    enabled the index is persisted (keyed by ASIN, taken from parent_asin
+    when not given) and reopened memory-mapped.
     """
     try:
         # Use DataFrameLoader to convert the DataFrame into documents
-        loader = DataFrameLoader(review_df)
-        review_docs = loader.load()
+        review_docs = dataframe_to_documents(review_df)
         logger.info(f"Loaded {len(review_docs)} review documents.")
     except Exception as e:
         logger.exception("Error loading documents from DataFrame: " + str(e))
         review_docs = []
-    
-    # Create embeddings using a HuggingFace model
-    embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
-    # Build the vector store using FAISS
-    vectordb = FAISS.from_documents(documents=review_docs, embedding=embeddings)
-    retriever = vectordb.as_retriever()
-    return retriever
 
-# ---------- Chatbot Chain Setup ----------
+    if asin is None and "parent_asin" in review_df.columns and not review_df.empty:
+        asin = str(review_df["parent_asin"].iloc[0])
+    # Build the vector store using FAISS with the shared embedding model
+    index = AsinIndex.build(asin, review_docs, registry.embeddings)
+    if index_store is not None and asin:
+        with index_store.lock(asin):
+            index = _persist_index(index)
+    return index
 
-def create_qa_chain(retriever) -> RetrievalQA:
+def create_retriever_from_df(review_df: pd.DataFrame, asin: str = None):
     """
-    Creates a RetrievalQA chain using an LLM and conversation memory.
+    Converts the review DataFrame into a vector database retriever using FAISS.
     """
-    # Initialize conversation memory to track chat history
-    memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True,output_key="answer")
-    # Initialize the chat LLM (e.g., GPT-4)
-    llm = ChatOpenAI(model_name="gpt-3.5-turbo", temperature=0.5)
-    system_prompt = '''You are a helpful AI assistant for Amazon sellers. 
+    return create_asin_index(review_df, asin).retriever
+
+def _open_stored_index(asin: str):
+    with span("index_open"):
+        loaded = index_store.load(asin, registry.embeddings)
+    if loaded is None:
+        return None
+    vectordb, state, version = loaded
+    return AsinIndex.from_state(asin, vectordb, state, version=version)
+
+def _persist_index(index: AsinIndex) -> AsinIndex:
+    """
+    Saves an index to the store and reopens it memory-mapped, so this worker
+    shares the file pages with the others. Call with the ASIN lock held.
+    """
+    if index_store is None:
+        return index
+    with span("index_persist"):
+        index_store.save(index.asin, index.vectordb, index.state())
+    return _open_stored_index(index.asin)
+
+def get_asin_index(asin: str):
+    """
+    Returns the up-to-date index for an ASIN.
+
+    Cached indexes are served as is until INDEX_REFRESH_SECONDS have passed;
+    then only reviews added or removed since the index's high-water mark are
+    fetched, embedded and applied. A full fetch and build happens only for an
+    ASIN that has no cached or persisted index yet. Concurrent callers for
+    the same ASIN (sync or async) share one build or refresh.
+    Returns None when the ASIN has no reviews; empty results are not cached.
+    """
+    index = retriever_cache.get(asin)
+    if index is not None and not index.is_stale(INDEX_REFRESH_SECONDS):
+        return index
+    return index_flight.do(asin, lambda: _load_asin_index(asin))
+
+def _load_asin_index(asin: str):
+    index = retriever_cache.get(asin)
+    if index is not None and not index.is_stale(INDEX_REFRESH_SECONDS):
+        # Built by a call that finished just before this one started
+        return index
+
+    lock = index_store.lock(asin) if index_store is not None else nullcontext()
+    with lock:
+        if index_store is not None:
+            # Pick up a newer version another worker built or refreshed
+            latest = index_store.latest_version(asin)
+            if latest is not None and (index is None or index.version != latest):
+                index = _open_stored_index(asin)
+
+        if index is None:
+            review_df = fetch_reviews(asin)
+            if review_df.empty:
+                return None
+            aggregate_cache.put(asin, compute_aggregates(review_df))
+            answer_cache.invalidate(asin)
+            with span("to_documents"):
+                review_docs = dataframe_to_documents(review_df)
+            index = _persist_index(AsinIndex.build(asin, review_docs, registry.embeddings))
+        else:
+            # The refreshed index is a new object; requests still searching
+            # the cached one finish on it undisturbed
+            try:
+                refreshed = index.refresh(data_source)
+            except Exception as e:
+                # Keep serving the current index; refreshed_at is already bumped,
+                # so the next attempt waits for the next refresh interval
+                logger.warning(f"Refresh failed for ASIN {asin}; serving the cached index: {e}")
+                refreshed = None
+            if refreshed is not None:
+                aggregate_cache.invalidate(asin)
+                answer_cache.invalidate(asin)
+                # Deltas stay in memory (other workers apply them from the shared
+                # embedding cache); only a compaction is saved as a new version
+                index = _persist_index(refreshed) if refreshed.vectordb is not index.vectordb else refreshed
+
+    retriever_cache.put(asin, index)
+    return index
+
+def get_retriever(asin: str):
+    """
+    Returns the retriever for an ASIN (see get_asin_index), or None when the
+    ASIN has no reviews.
+    """
+    index = get_asin_index(asin)
+    return index.retriever if index is not None else None
+
+async def aget_asin_index(asin: str, executor=None):
+    """
+    Async variant of get_asin_index: cache hits return immediately; fetching
+    and (re)building run on ``executor`` (the CPU executor by default), off
+    the event loop, and are shared with concurrent callers for the same ASIN.
+    A build is started only when the index build queue admits it (Overloaded
+    otherwise) and, once started, finishes even if its callers give up.
+    """
+    index = retriever_cache.get(asin)
+    if index is not None and not index.is_stale(INDEX_REFRESH_SECONDS):
+        return index
+    return await index_flight.ado(asin, lambda: _load_asin_index(asin), executor or cpu_executor,
+                                  admission=index_build_queue.slot)
+
+async def aget_retriever(asin: str):
+    """
+    Async variant of get_retriever.
+    """
+    index = await aget_asin_index(asin)
+    return index.retriever if index is not None else None
+
+# ---------- Aggregate Fast Path ----------
+
+def get_aggregates(asin: str):
+    """
+    Cached per-ASIN review statistics; fetches the reviews on a miss.
+    Returns None when the ASIN has no reviews.
+    """
+    def build():
+        review_df = fetch_reviews(asin)
+        return None if review_df.empty else compute_aggregates(review_df)
+
+    return aggregate_cache.get_or_build(asin, lambda: aggregate_flight.do(asin, build))
+
+def answer_from_aggregates(asin: str, user_question: str):
+    """
+    Answers aggregate/statistical questions from the full review set.
+    Returns None when the question needs the retrieval + LLM path.
+    """
+    if not AGGREGATE_FAST_PATH:
+        return None
+    intent = detect_intent(user_question)
+    if intent is None:
+        return None
+    with span("aggregates"):
+        aggregates = get_aggregates(asin)
+    if aggregates is None:
+        return None
+    answer = answer_aggregate(intent, aggregates)
+    if answer is not None:
+        count(FAST_PATH_ANSWERS, source="aggregates")
+        logger.info(f"Answered '{intent}' question for ASIN {asin} from precomputed aggregates")
+    return answer
+
+async def aanswer_from_aggregates(asin: str, user_question: str):
+    """
+    Async variant of answer_from_aggregates; only a cache miss leaves the event loop.
+    """
+    if not AGGREGATE_FAST_PATH or detect_intent(user_question) is None:
+        return None
+    if asin in aggregate_cache:
+        return answer_from_aggregates(asin, user_question)
+    return await asyncio.to_thread(answer_from_aggregates, asin, user_question)
+
+# ---------- Chatbot Chain Setup ----------
+
+SYSTEM_PROMPT = '''You are a helpful AI assistant for Amazon sellers. 
                             Your job is to analyze product reviews and metadata to answer seller queries.. 
                             Your responses should be clear, concise, and insightful.
 
@@ -140,49 +354,408 @@ def create_qa_chain(retriever) -> RetrievalQA:
                             - Format your response in a readable way.
                             '''
 
-    PROMPT = PromptTemplate(template=system_prompt, input_variables=["context", "question"])
+def create_qa_chain(retriever, memory=None):
+    """
+    Creates a RetrievalQA chain using an LLM and conversation memory.
+    Pass ``memory`` to continue an existing conversation (see session_store.py).
+    """
+    from langchain.memory import ConversationBufferMemory
+    from langchain.prompts import PromptTemplate
+    from langchain.chains import ConversationalRetrievalChain
+    # Initialize conversation memory to track chat history
+    if memory is None:
+        memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True,output_key="answer")
+    # Shared chat LLM client (e.g., GPT-3.5) from the model registry
+    llm = registry.llm
+
+    PROMPT = PromptTemplate(template=SYSTEM_PROMPT, input_variables=["context", "question"])
     # Build a RetrievalQA chain using a simple "stuff" chain type
     qa_chain = ConversationalRetrievalChain.from_llm(llm=llm, retriever=retriever, memory=memory, return_source_documents=True,
         combine_docs_chain_kwargs={'prompt': PROMPT})
     # qa_chain = RetrievalQA.from_chain_type(llm=llm, chain_type="stuff", retriever=retriever, memory=memory, combine_docs_chain_kwargs={"prompt": PROMPT})
     return qa_chain
 
+def format_context(docs) -> str:
+    """
+    Joins retrieved documents the same way the "stuff" chain does. The hybrid
+    retriever has already packed them (compact metadata, token budget).
+    """
+    return "\n\n".join(doc.page_content for doc in docs)
+
+def build_prompt(docs, question: str) -> str:
+    """
+    Renders SYSTEM_PROMPT for a question and its retrieved documents.
+    """
+    return SYSTEM_PROMPT.format(context=format_context(docs), question=question)
+
+def create_session_chain(retriever):
+    """
+    QA chain for a server-side session, with bounded, summarizing memory.
+    """
+    return create_qa_chain(retriever, memory=session_store.create_memory(registry.llm))
+
+def source_metadata(docs) -> list:
+    """
+    Metadata of retrieved documents, as returned to API clients.
+    """
+    return [dict(doc.metadata) for doc in docs]
+
+def cached_answer(asin: str, index: AsinIndex, question_vector):
+    """
+    Stored answer for a question similar to ``question_vector``, or None.
+    """
+    if not ANSWER_CACHE_ENABLED:
+        return None
+    cached = answer_cache.lookup(asin, question_vector, version=index.version)
+    if cached is not None:
+        count(FAST_PATH_ANSWERS, source="answer_cache")
+    return cached
+
+def store_answer(asin: str, index: AsinIndex, question_vector, user_question: str, answer: str, docs):
+    if ANSWER_CACHE_ENABLED:
+        answer_cache.store(asin, question_vector, user_question, answer, source_metadata(docs),
+                           version=index.version)
 
 def chatbot(asin, user_question):
     try:
         logger.info(f"Processing ASIN: {asin}")
-        # Fetch reviews and metadata
-        review_df = fetch_reviews(asin)
-        meta_df = fetch_metadata(asin)
+        # Aggregate questions are answered from statistics over all reviews
+        fast_answer = answer_from_aggregates(asin, user_question)
+        if fast_answer is not None:
+            return fast_answer
 
-        if review_df.empty:
+        # Look up (or fetch reviews and build) the index for this ASIN
+        index = get_asin_index(asin)
+
+        if index is None:
             logger.warning(f"No reviews found for ASIN: {asin}")
             return "No review data found for the provided ASIN.", []
 
-        # Create a retriever from the reviews DataFrame
-        retriever = create_retriever_from_df(review_df)
+        # Near-identical questions reuse an earlier answer
+        question_vector = embed_question(user_question) if ANSWER_CACHE_ENABLED else None
+        cached = cached_answer(asin, index, question_vector) if question_vector is not None else None
+        if cached is not None:
+            return cached["answer"]
 
         # Create the QA chain using the retriever
-        qa_chain = create_qa_chain(retriever)
+        qa_chain = create_qa_chain(index.retriever)
 
         # Generate an answer using the QA chain
-        answer = qa_chain.invoke({'question': user_question})
+        answer = qa_chain.invoke({'question': user_question}, config={"callbacks": llm_callbacks()})
         logger.info(f"Generated response: {answer['answer']}")
-        # Extract conversation history
-        conversation_history = qa_chain.memory.chat_memory.messages
-        for msg in qa_chain.memory.chat_memory.messages:
-            if isinstance(msg, HumanMessage):
-                role = "User"
-            elif isinstance(msg, AIMessage):
-                role = "Assistant"
-            elif isinstance(msg, SystemMessage):
-                role = "System"
-            else:
-                role = "Unknown"
-            content = msg.content
-
+        if question_vector is not None:
+            store_answer(asin, index, question_vector, user_question, answer['answer'], answer['source_documents'])
         return answer['answer'] 
 
     except Exception as e:
         logger.error(f"Chatbot error: {str(e)}")
         return f"Error processing query: {str(e)}", []
+
+
+async def achatbot(asin, user_question, session_id=None):
+    """
+    Non-blocking variant of chatbot() for the FastAPI endpoint: nothing in the
+    fetch / index build / LLM pipeline runs on the event loop.
+    With a ``session_id`` the question is answered in that session's
+    conversation (follow-ups see earlier turns); without one it is stateless.
+    """
+    try:
+        logger.info(f"Processing ASIN: {asin}")
+        fast_answer = await aanswer_from_aggregates(asin, user_question)
+        if fast_answer is not None:
+            return fast_answer
+
+        # The build is shared with other requests and keeps running if this one gives up
+        index = await within_deadline(aget_asin_index(asin), "index_build")
+
+        if index is None:
+            logger.warning(f"No reviews found for ASIN: {asin}")
+            return "No review data found for the provided ASIN.", []
+
+        if session_id:
+            session = session_store.get_session(session_id, asin, index.retriever, create_session_chain)
+            async with session.lock:
+                answer = await call_llm(lambda: session.chain.ainvoke({'question': user_question},
+                                                                      config={"callbacks": llm_callbacks()}))
+        else:
+            # Stateless questions may reuse the answer to a near-identical earlier one
+            question_vector = None
+            if ANSWER_CACHE_ENABLED:
+                question_vector = await _embedding_stage(embed_question, user_question)
+                cached = cached_answer(asin, index, question_vector)
+                if cached is not None:
+                    return cached["answer"]
+            # Retrieval and the LLM call are admitted as separate stages; without
+            # history this is the same prompt the "stuff" QA chain builds
+            docs = await _embedding_stage(index.retriever.retrieve, user_question, question_vector)
+            response = await call_llm(lambda: registry.llm.ainvoke(build_prompt(docs, user_question),
+                                                                   config={"callbacks": llm_callbacks()}))
+            answer = {'answer': response.content, 'source_documents': docs}
+            if question_vector is not None:
+                store_answer(asin, index, question_vector, user_question, answer['answer'], docs)
+        logger.info(f"Generated response: {answer['answer']}")
+        return answer['answer']
+
+    except AdmissionError:
+        raise
+    except Exception as e:
+        logger.error(f"Chatbot error: {str(e)}")
+        return f"Error processing query: {str(e)}", []
+
+
+async def astream_chat(asin, user_question, session_id=None):
+    """
+    Streams an answer as events: one "sources" event with the retrieved
+    documents' metadata, "token" events as the LLM generates, then a "done"
+    event with the full answer. Cancelling the consumer cancels the LLM call.
+    With a ``session_id`` the session's history is included in the prompt and
+    the finished turn is saved to it.
+    """
+    logger.info(f"Streaming answer for ASIN: {asin}")
+    start = time.perf_counter()
+    fast_answer = await aanswer_from_aggregates(asin, user_question)
+    if fast_answer is not None:
+        yield {"event": "sources", "data": []}
+        yield {"event": "token", "data": fast_answer}
+        yield {"event": "done", "data": {"answer": fast_answer, "num_sources": 0,
+                                         "elapsed_seconds": round(time.perf_counter() - start, 3)}}
+        return
+
+    index = await within_deadline(aget_asin_index(asin), "index_build")
+    if index is None:
+        logger.warning(f"No reviews found for ASIN: {asin}")
+        yield {"event": "error", "data": {"detail": "No review data found for the provided ASIN."}}
+        return
+    retriever = index.retriever
+
+    question_vector = None
+    if not session_id and ANSWER_CACHE_ENABLED:
+        question_vector = await _embedding_stage(embed_question, user_question)
+        cached = cached_answer(asin, index, question_vector)
+        if cached is not None:
+            yield {"event": "sources", "data": cached["sources"]}
+            yield {"event": "token", "data": cached["answer"]}
+            yield {"event": "done", "data": {"answer": cached["answer"], "num_sources": len(cached["sources"]),
+                                             "cached": True,
+                                             "elapsed_seconds": round(time.perf_counter() - start, 3)}}
+            return
+
+    session = None
+    if session_id:
+        session = session_store.get_session(session_id, asin, retriever, create_session_chain)
+        await session.lock.acquire()
+    try:
+        question = user_question
+        if session is not None:
+            from langchain_core.messages import get_buffer_string
+            history = get_buffer_string(session.memory.load_memory_variables({})["chat_history"])
+            if history:
+                question = f"Conversation so far:\n{history}\n\nFollow-up question: {user_question}"
+
+        docs = await _embedding_stage(retriever.retrieve, user_question, question_vector)
+        yield {"event": "sources", "data": source_metadata(docs)}
+
+        chunks = []
+        # The LLM slot is held for the whole stream. Every token is awaited
+        # within the deadline, the first one also within LLM_FIRST_TOKEN_SECONDS
+        async with llm_queue.slot():
+            stream = registry.llm.astream(build_prompt(docs, question), config={"callbacks": llm_callbacks()})
+            timeout = LLM_FIRST_TOKEN_SECONDS or None
+            try:
+                while True:
+                    try:
+                        chunk = await within_deadline(stream.__anext__(), "llm", timeout=timeout)
+                    except StopAsyncIteration:
+                        break
+                    timeout = None
+                    if chunk.content:
+                        chunks.append(chunk.content)
+                        yield {"event": "token", "data": chunk.content}
+            finally:
+                await stream.aclose()
+
+        answer = "".join(chunks)
+        logger.info(f"Generated response: {answer}")
+        if session is not None:
+            await session.memory.asave_context({"question": user_question}, {"answer": answer})
+        elif question_vector is not None:
+            store_answer(asin, index, question_vector, user_question, answer, docs)
+        yield {"event": "done", "data": {"answer": answer, "num_sources": len(docs),
+                                         "elapsed_seconds": round(time.perf_counter() - start, 3)}}
+    finally:
+        if session is not None:
+            session.lock.release()
+
+
+async def abatch_chat(asin, questions, max_concurrency=None):
+    """
+    Answers many questions about one ASIN. The retriever is looked up once,
+    all questions are embedded in a single batched call (the hybrid retriever
+    reuses those vectors), and the LLM calls
+    run concurrently (at most ``max_concurrency`` at a time).
+    Returns None when the ASIN has no reviews, otherwise one result dict per
+    question (answer, sources, timings, or an error).
+    """
+    index = await within_deadline(aget_asin_index(asin), "index_build")
+    if index is None:
+        logger.warning(f"No reviews found for ASIN: {asin}")
+        return None
+    retriever = index.retriever
+    semaphore = asyncio.Semaphore(max(1, max_concurrency or BATCH_LLM_CONCURRENCY))
+
+    async def answer_one(question, vector, docs, start, retrieval_seconds):
+        try:
+            async with semaphore:
+                llm_start = time.perf_counter()
+                response = await call_llm(lambda: registry.llm.ainvoke(build_prompt(docs, question),
+                                                                       config={"callbacks": llm_callbacks()}))
+                llm_seconds = time.perf_counter() - llm_start
+            store_answer(asin, index, vector, question, response.content, docs)
+            return {"question": question, "answer": response.content, "sources": source_metadata(docs),
+                    "timings": {"retrieval_seconds": round(retrieval_seconds, 4),
+                                "llm_seconds": round(llm_seconds, 4),
+                                "total_seconds": round(time.perf_counter() - start, 4)}}
+        except AdmissionError as e:
+            return {"question": question, "error": str(e), "retry_after": e.retry_after}
+        except Exception as e:
+            logger.error(f"Batch question failed for ASIN {asin}: {str(e)}")
+            return {"question": question, "error": str(e)}
+
+    async def prepare_one(question, vector):
+        # A finished result (fast path, cached answer or error), or a task
+        # answering the question from its retrieved reviews
+        start = time.perf_counter()
+        try:
+            fast_answer = await aanswer_from_aggregates(asin, question)
+            if fast_answer is not None:
+                return {"question": question, "answer": fast_answer, "sources": [],
+                        "timings": {"total_seconds": round(time.perf_counter() - start, 4)}}
+            cached = cached_answer(asin, index, vector)
+            if cached is not None:
+                return {"question": question, "answer": cached["answer"], "sources": cached["sources"],
+                        "cached": True, "timings": {"total_seconds": round(time.perf_counter() - start, 4)}}
+            docs = await within_deadline(_run_on(cpu_executor, retriever.retrieve, question, vector), "embedding")
+        except AdmissionError as e:
+            return {"question": question, "error": str(e), "retry_after": e.retry_after}
+        except Exception as e:
+            logger.error(f"Batch question failed for ASIN {asin}: {str(e)}")
+            return {"question": question, "error": str(e)}
+        return asyncio.ensure_future(answer_one(question, vector, docs, start, time.perf_counter() - start))
+
+    # The batch takes a single embedding slot for embedding and retrieving
+    # all of its questions (one after another), so a large batch cannot fill
+    # the embedding queue; each LLM call starts as soon as its reviews are ready
+    prepared = []
+    try:
+        async with embedding_queue.slot():
+            embed_start = time.perf_counter()
+            with span("embed_query"):
+                query_vectors = await within_deadline(
+                    _run_on(cpu_executor, registry.embed_queries, list(questions)), "embedding")
+            embed_seconds = time.perf_counter() - embed_start
+            for question, vector in zip(questions, query_vectors):
+                prepared.append(await prepare_one(question, vector))
+    except BaseException:
+        for item in prepared:
+            if isinstance(item, asyncio.Future):
+                item.cancel()
+        raise
+
+    results = [await item if isinstance(item, asyncio.Future) else item for item in prepared]
+    logger.info(f"Answered {len(results)} batched questions for ASIN: {asin} "
+                f"(query embedding {embed_seconds:.3f}s)")
+    return results
+
+
+def _search_shard(index: AsinIndex, question: str, query_vector, k: int):
+    """
+    Top-``k`` fused candidates of one ASIN's index as (doc, score) pairs, with
+    the shard's ASIN recorded in each document's metadata.
+    """
+    from langchain_core.documents import Document
+
+    asin = index.asin
+    return [(Document(page_content=doc.page_content, metadata={**doc.metadata, "parent_asin": asin}), score)
+            for doc, score in index.retriever.candidates(question, query_vector)[:k]]
+
+
+MULTI_ASIN_INSTRUCTION = ("The reviews above cover several products, each labelled with its ASIN. "
+                          "Name the ASIN whenever an insight applies to specific products.")
+
+async def amulti_asin_chat(user_question, asins=None, seller_id=None, top_k=None):
+    """
+    Answers a question across many products: the ASINs given, or every ASIN
+    of ``seller_id``. Each per-ASIN index is searched as a shard (in parallel,
+    at most MULTI_ASIN_FANOUT at a time, on the shard executor), the shard
+    candidates are merged and reranked into one global top-k, and the LLM is
+    called once. Every source carries the ASIN it came from.
+    Returns None when none of the ASINs has reviews.
+    """
+    start = time.perf_counter()
+    if seller_id:
+        asins = await _run_on(shard_executor, fetch_seller_asins, seller_id)
+    asins = list(dict.fromkeys(asins or []))
+    skipped = asins[MULTI_ASIN_MAX_SHARDS:]
+    asins = asins[:MULTI_ASIN_MAX_SHARDS]
+    if not asins:
+        return None
+    if skipped:
+        logger.warning(f"Searching the first {len(asins)} ASINs; skipping {len(skipped)} more")
+
+    async with embedding_queue.slot():
+        query_vector = await within_deadline(_run_on(shard_executor, embed_question, user_question), "embedding")
+    semaphore = asyncio.Semaphore(max(1, MULTI_ASIN_FANOUT))
+
+    async def search(asin):
+        async with semaphore:
+            try:
+                # Builds of uncached shards are admitted like any other index build
+                index = await within_deadline(aget_asin_index(asin, shard_executor), "index_build")
+                if index is None:
+                    return asin, None, None
+                return asin, await within_deadline(_run_on(
+                    shard_executor, _search_shard, index, user_question, query_vector, SHARD_TOP_K), "shard_search"), None
+            except AdmissionError:
+                raise
+            except Exception as e:
+                logger.error(f"Shard search failed for ASIN {asin}: {str(e)}")
+                return asin, None, str(e)
+
+    shard_results = await asyncio.gather(*(search(asin) for asin in asins))
+    search_seconds = time.perf_counter() - start
+
+    merged, searched, without_reviews, failed = [], [], [], {}
+    for asin, scored, error in shard_results:
+        if error is not None:
+            failed[asin] = error
+        elif scored is None:
+            without_reviews.append(asin)
+        else:
+            searched.append(asin)
+            merged.extend(scored)
+    if not searched:
+        if failed:
+            raise RuntimeError(f"All {len(failed)} shard searches failed")
+        return None
+
+    # Fused shard scores are rank-based and so comparable across shards; the
+    # reranker then scores the best of them against the question directly
+    merged.sort(key=lambda item: item[1], reverse=True)
+    merged = merged[:max(top_k or MULTI_ASIN_TOP_K, 1) * 3]
+    merged = await _run_on(shard_executor, rerank_documents, user_question, merged)
+    top = merged[:top_k or MULTI_ASIN_TOP_K]
+    docs = pack_documents([doc for doc, _ in top], include_asin=True)
+
+    llm_start = time.perf_counter()
+    response = await call_llm(lambda: registry.llm.ainvoke(
+        build_prompt(docs, f"{user_question}\n{MULTI_ASIN_INSTRUCTION}"), config={"callbacks": llm_callbacks()}))
+    llm_seconds = time.perf_counter() - llm_start
+    sources = [{**source, "score": round(score, 4)} for source, (_, score) in zip(source_metadata(docs), top)]
+    logger.info(f"Answered multi-ASIN question over {len(searched)} ASINs "
+                f"({len(failed)} failed, {len(skipped)} skipped)")
+    return {"answer": response.content, "sources": sources,
+            "asins_searched": searched, "asins_without_reviews": without_reviews,
+            "asins_failed": failed, "asins_skipped": skipped,
+            "timings": {"shard_search_seconds": round(search_seconds, 4),
+                        "llm_seconds": round(llm_seconds, 4),
+                        "total_seconds": round(time.perf_counter() - start, 4)}}
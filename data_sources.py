@@ -0,0 +1,317 @@
+import os
+import re
+import hashlib
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# "bigquery" queries live tables per request; "parquet" serves a local snapshot
+REVIEW_DATA_SOURCE = os.getenv("REVIEW_DATA_SOURCE", "bigquery")
+PARQUET_DATA_ROOT = os.getenv("PARQUET_DATA_ROOT", "data/snapshot")
+
+REVIEWS_TABLE = os.getenv(
+    "REVIEWS_TABLE", "spheric-engine-451615-a8.Amazon_Reviews_original_dataset_v3.Amazon_dataset_V3")
+METADATA_TABLE = os.getenv(
+    "METADATA_TABLE", "spheric-engine-451615-a8.Amazon_Reviews_original_dataset_v4.meta_data")
+
+# Only the columns the chatbot embeds or reports on are transferred; images,
+# user_id and similar columns are never used downstream.
+REVIEW_COLUMNS = [
+    "review_id", "parent_asin", "asin", "text", "title", "rating", "helpful_vote",
+    "verified_purchase", "timestamp", "Category", "seller_id",
+]
+# Columns needed to diff a cached index against the source (see asin_index.py)
+REVIEW_KEY_COLUMNS = ["review_id", "timestamp"]
+
+# Reviews have no id column upstream, so a stable one is derived from
+# (user_id, asin, timestamp). The SQL and Python forms must produce the same value.
+REVIEW_ID_SQL = ("TO_HEX(MD5(CONCAT(IFNULL(user_id, ''), '|', IFNULL(asin, ''), '|', "
+                 "IFNULL(CAST(timestamp AS STRING), ''))))")
+COMPUTED_COLUMNS = {"review_id": REVIEW_ID_SQL}
+METADATA_COLUMNS = [
+    "parent_asin", "title", "main_category", "average_rating", "rating_number",
+    "features", "description", "price", "store", "categories", "details",
+]
+
+# Sub-directories of a snapshot written by ingest_snapshot.py
+REVIEWS_DATASET = "reviews"
+METADATA_DATASET = "metadata"
+PARTITION_COLUMN = "parent_asin"
+
+_SAFE_ASIN = re.compile(r"^[A-Za-z0-9_-]+$")
+
+
+def review_id_for(user_id, asin, timestamp) -> str:
+    """
+    Python equivalent of REVIEW_ID_SQL.
+    """
+    parts = ["" if value is None or value is pd.NA else str(value) for value in (user_id, asin, timestamp)]
+    return hashlib.md5("|".join(parts).encode("utf-8")).hexdigest()
+
+
+def add_review_ids(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Adds a review_id column derived from user_id, asin and timestamp.
+    """
+    df = df.copy()
+    df["review_id"] = [review_id_for(u, a, t) for u, a, t in
+                       zip(df["user_id"].tolist(), df["asin"].tolist(), df["timestamp"].tolist())]
+    return df
+
+
+class BigQuerySource:
+    """
+    Fetches reviews and metadata for an ASIN from BigQuery.
+
+    One client (and one BigQuery Storage read client) is created lazily and
+    shared by every request. Queries are parameterized and column-projected,
+    and results are read through the Storage API into Arrow-backed DataFrames.
+
+    Args:
+        client: Optional pre-built client. Anything with the
+            ``query(sql, job_config=...)`` interface of ``bigquery.Client``
+            works, so tests can pass a local fake.
+        bqstorage_client: Optional Storage API read client (skipped for fakes).
+    """
+
+    def __init__(self, client=None, bqstorage_client=None,
+                 reviews_table: str = REVIEWS_TABLE, metadata_table: str = METADATA_TABLE,
+                 review_columns=None, metadata_columns=None):
+        self._client = client
+        self._bqstorage_client = bqstorage_client
+        self._use_storage_api = client is None or bqstorage_client is not None
+        self._lock = threading.Lock()
+        self.reviews_table = reviews_table
+        self.metadata_table = metadata_table
+        self.review_columns = review_columns or REVIEW_COLUMNS
+        self.metadata_columns = metadata_columns or METADATA_COLUMNS
+        # Shared pool so the reviews and metadata queries of a request run side by side
+        self._executor = ThreadPoolExecutor(max_workers=int(os.getenv("BIGQUERY_FETCH_WORKERS", "8")),
+                                            thread_name_prefix="bq-fetch")
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    from google.cloud import bigquery
+                    self._client = bigquery.Client()
+        return self._client
+
+    @property
+    def bqstorage_client(self):
+        if self._bqstorage_client is None and self._use_storage_api:
+            with self._lock:
+                if self._bqstorage_client is None and self._use_storage_api:
+                    try:
+                        from google.cloud import bigquery_storage
+                        self._bqstorage_client = bigquery_storage.BigQueryReadClient()
+                    except ImportError:
+                        logger.warning("google-cloud-bigquery-storage not installed; using REST reads.")
+                        self._use_storage_api = False
+        return self._bqstorage_client
+
+    def _query(self, table: str, columns, asin: str, since: int = None) -> pd.DataFrame:
+        from google.cloud import bigquery
+
+        select = ", ".join(f"{COMPUTED_COLUMNS[column]} AS `{column}`" if column in COMPUTED_COLUMNS
+                           else f"`{column}`" for column in columns)
+        params = [bigquery.ScalarQueryParameter("asin", "STRING", asin)]
+        where = "parent_asin = @asin"
+        if since is not None:
+            where += " AND timestamp > @since"
+            params.append(bigquery.ScalarQueryParameter("since", "INT64", int(since)))
+        query = f"""
+        SELECT {select}
+        FROM `{table}`
+        WHERE {where}
+        """
+        job_config = bigquery.QueryJobConfig(query_parameters=params)
+        rows = self.client.query(query, job_config=job_config)
+        table = rows.to_arrow(bqstorage_client=self.bqstorage_client)
+        return table.to_pandas(types_mapper=pd.ArrowDtype)
+
+    def fetch_reviews(self, asin: str, since: int = None) -> pd.DataFrame:
+        """
+        Fetches product review data for a given ASIN, optionally only the
+        reviews with a timestamp after ``since``.
+        """
+        try:
+            review_df = self._query(self.reviews_table, self.review_columns, asin, since=since)
+            logger.info(f"Fetched {len(review_df)} review records for ASIN: {asin}")
+        except Exception as e:
+            logger.exception(f"Error fetching reviews for ASIN {asin}: {e}")
+            review_df = pd.DataFrame()
+        return review_df
+
+    def fetch_review_keys(self, asin: str) -> pd.DataFrame:
+        """
+        Fetches only review_id and timestamp of every review of an ASIN.
+        Errors propagate so a failed lookup is never mistaken for "no reviews".
+        """
+        return self._query(self.reviews_table, REVIEW_KEY_COLUMNS, asin)
+
+    def fetch_seller_asins(self, seller_id: str) -> list:
+        """
+        Parent ASINs of a seller's products, most-reviewed first.
+        Errors propagate so a failed lookup is never mistaken for "no products".
+        """
+        from google.cloud import bigquery
+
+        query = f"""
+        SELECT parent_asin, COUNT(*) AS num_reviews
+        FROM `{self.reviews_table}`
+        WHERE CAST(seller_id AS STRING) = @seller_id
+        GROUP BY parent_asin
+        ORDER BY num_reviews DESC
+        """
+        # seller_id is stored as an integer in some tables and as a string in others
+        job_config = bigquery.QueryJobConfig(
+            query_parameters=[bigquery.ScalarQueryParameter("seller_id", "STRING", str(seller_id))])
+        table = self.client.query(query, job_config=job_config).to_arrow(bqstorage_client=self.bqstorage_client)
+        return [str(asin) for asin in table.column("parent_asin").to_pylist() if asin]
+
+    def fetch_metadata(self, asin: str) -> pd.DataFrame:
+        """
+        Fetches product metadata for a given ASIN.
+        """
+        try:
+            meta_df = self._query(self.metadata_table, self.metadata_columns, asin)
+            logger.info(f"Fetched {len(meta_df)} metadata records for ASIN: {asin}")
+        except Exception as e:
+            logger.exception(f"Error fetching metadata for ASIN {asin}: {e}")
+            meta_df = pd.DataFrame()
+        return meta_df
+
+    def fetch_all(self, asin: str):
+        """
+        Fetches reviews and metadata concurrently; returns (review_df, meta_df).
+        """
+        meta_future = self._executor.submit(self.fetch_metadata, asin)
+        review_df = self.fetch_reviews(asin)
+        return review_df, meta_future.result()
+
+
+class ParquetSource:
+    """
+    Serves reviews and metadata from a local Parquet snapshot.
+
+    The snapshot (see ingest_snapshot.py) is hive-partitioned by parent_asin,
+    e.g. ``<root>/reviews/parent_asin=B07LFV749P/part-0.parquet``, so a lookup
+    opens only the files of that one partition and never scans other ASINs.
+    Files are read with memory mapping and only the projected columns are
+    decoded.
+    """
+
+    def __init__(self, root: str = PARQUET_DATA_ROOT, review_columns=None, metadata_columns=None):
+        self.root = root
+        self.review_columns = review_columns or REVIEW_COLUMNS
+        self.metadata_columns = metadata_columns or METADATA_COLUMNS
+
+    def _read(self, dataset_name: str, columns, asin: str, since: int = None) -> pd.DataFrame:
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+        from pyarrow import fs
+
+        if not _SAFE_ASIN.match(asin):
+            raise ValueError(f"Invalid ASIN: {asin!r}")
+        partition_dir = os.path.abspath(os.path.join(self.root, dataset_name, f"{PARTITION_COLUMN}={asin}"))
+        if not os.path.isdir(partition_dir):
+            return pd.DataFrame()
+        # Memory-mapped local reads; the optional filter is pushed down to row groups
+        dataset = ds.dataset(partition_dir, format="parquet", filesystem=fs.LocalFileSystem(use_mmap=True))
+        # The partition value lives in the directory name, not in the files
+        names = dataset.schema.names
+        present = [c for c in columns if c in names]
+        # Snapshots ingested without review_id get it derived on read
+        derive_ids = "review_id" in columns and "review_id" not in names and "user_id" in names
+        if derive_ids:
+            present += [c for c in ("user_id", "asin", "timestamp") if c not in present]
+        filter = ds.field("timestamp") > since if since is not None else None
+        table = dataset.to_table(columns=present, filter=filter)
+        if PARTITION_COLUMN in columns and PARTITION_COLUMN not in present:
+            table = table.append_column(PARTITION_COLUMN, pa.array([asin] * table.num_rows, pa.string()))
+        df = table.to_pandas(types_mapper=pd.ArrowDtype)
+        if derive_ids:
+            df = add_review_ids(df)[[c for c in columns if c in df.columns or c == "review_id"]]
+        return df
+
+    def fetch_reviews(self, asin: str, since: int = None) -> pd.DataFrame:
+        """
+        Reads product review data for a given ASIN from the snapshot, optionally
+        only the reviews with a timestamp after ``since`` (pushed down to the scan).
+        """
+        try:
+            review_df = self._read(REVIEWS_DATASET, self.review_columns, asin, since=since)
+            logger.info(f"Read {len(review_df)} review records for ASIN: {asin}")
+        except Exception as e:
+            logger.exception(f"Error reading reviews for ASIN {asin}: {e}")
+            review_df = pd.DataFrame()
+        return review_df
+
+    def fetch_review_keys(self, asin: str) -> pd.DataFrame:
+        """
+        Reads only review_id and timestamp of every review of an ASIN.
+        """
+        return self._read(REVIEWS_DATASET, REVIEW_KEY_COLUMNS, asin)
+
+    def fetch_seller_asins(self, seller_id: str) -> list:
+        """
+        Parent ASINs of a seller's products, most-reviewed first. Scans only
+        the seller_id column of the snapshot, with the filter pushed down.
+        """
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+        from pyarrow import fs
+
+        reviews_dir = os.path.abspath(os.path.join(self.root, REVIEWS_DATASET))
+        if not os.path.isdir(reviews_dir):
+            return []
+        dataset = ds.dataset(reviews_dir, format="parquet", partitioning="hive",
+                             filesystem=fs.LocalFileSystem(use_mmap=True))
+        if "seller_id" not in dataset.schema.names:
+            return []
+        # Compare in the column's own type (often int64) so the filter is still pushed down
+        try:
+            seller = pa.scalar(str(seller_id)).cast(dataset.schema.field("seller_id").type)
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+            # e.g. a non-numeric id against an integer column: no such seller
+            return []
+        table = dataset.to_table(columns=[PARTITION_COLUMN], filter=ds.field("seller_id") == seller)
+        counts = table.group_by(PARTITION_COLUMN).aggregate([(PARTITION_COLUMN, "count")])
+        counts = counts.sort_by([(f"{PARTITION_COLUMN}_count", "descending")])
+        return [str(asin) for asin in counts.column(PARTITION_COLUMN).to_pylist() if asin]
+
+    def fetch_metadata(self, asin: str) -> pd.DataFrame:
+        """
+        Reads product metadata for a given ASIN from the snapshot.
+        """
+        try:
+            meta_df = self._read(METADATA_DATASET, self.metadata_columns, asin)
+            logger.info(f"Read {len(meta_df)} metadata records for ASIN: {asin}")
+        except Exception as e:
+            logger.exception(f"Error reading metadata for ASIN {asin}: {e}")
+            meta_df = pd.DataFrame()
+        return meta_df
+
+    def fetch_all(self, asin: str):
+        """
+        Reads reviews and metadata; local reads are fast enough to run serially.
+        """
+        return self.fetch_reviews(asin), self.fetch_metadata(asin)
+
+
+def create_data_source(kind: str = None):
+    """
+    Builds the data source selected by REVIEW_DATA_SOURCE ("bigquery" or "parquet").
+    """
+    kind = (kind or REVIEW_DATA_SOURCE).lower()
+    if kind == "bigquery":
+        return BigQuerySource()
+    if kind == "parquet":
+        return ParquetSource(PARQUET_DATA_ROOT)
+    raise ValueError(f"Unknown REVIEW_DATA_SOURCE: {kind!r} (expected 'bigquery' or 'parquet')")
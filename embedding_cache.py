@@ -0,0 +1,187 @@
+import os
+import re
+import json
+import fcntl
+import hashlib
+import logging
+import threading
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_KEY_BYTES = 16
+_VECTORS_FILE = "vectors.bin"
+_KEYS_FILE = "keys.bin"
+_META_FILE = "meta.json"
+_LOCK_FILE = ".lock"
+
+
+def normalize_text(text: str) -> str:
+    """
+    Whitespace-insensitive form of a text, so trivially reformatted reviews share a key.
+    """
+    return " ".join(str(text).split())
+
+
+class EmbeddingCache:
+    """
+    Persistent, content-addressed cache of text embeddings for one model.
+
+    Layout under ``<root>/<model>/``:
+        vectors.bin  rows of ``dim`` float16/float32 values, append-only
+        keys.bin     16-byte BLAKE2b digests of (model name, normalized text),
+                     where the i-th key belongs to the i-th vector row
+    The vectors file is memory-mapped for reads and new embeddings are appended
+    in batches under a file lock, so all workers on a host share one cache.
+    """
+
+    def __init__(self, root: str, model_name: str, dtype: str = "float16"):
+        self.model_name = model_name
+        self.dtype = np.dtype(dtype)
+        self.dir = os.path.join(root, re.sub(r"[^A-Za-z0-9_.-]", "_", model_name))
+        os.makedirs(self.dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._rows = {}
+        self._dim = None
+        self._vectors = None
+        self._num_rows = 0
+        self.hits = 0
+        self.misses = 0
+        self._load_meta()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.dir, name)
+
+    def _load_meta(self):
+        path = self._path(_META_FILE)
+        if os.path.exists(path):
+            with open(path) as f:
+                meta = json.load(f)
+            self._dim = meta["dim"]
+            self.dtype = np.dtype(meta["dtype"])
+
+    def key(self, text: str) -> bytes:
+        digest = hashlib.blake2b(digest_size=_KEY_BYTES)
+        digest.update(self.model_name.encode("utf-8"))
+        digest.update(b"\x00")
+        digest.update(normalize_text(text).encode("utf-8"))
+        return digest.digest()
+
+    def _refresh(self):
+        """
+        Picks up rows appended since the last refresh (by any process).
+        Must be called with self._lock held.
+        """
+        if self._dim is None:
+            self._load_meta()
+            if self._dim is None:
+                return
+        keys_path = self._path(_KEYS_FILE)
+        vectors_path = self._path(_VECTORS_FILE)
+        if not os.path.exists(keys_path) or not os.path.exists(vectors_path):
+            return
+        row_bytes = self._dim * self.dtype.itemsize
+        # Vectors are written before keys, so a visible key always has its row
+        num_rows = min(os.path.getsize(keys_path) // _KEY_BYTES, os.path.getsize(vectors_path) // row_bytes)
+        if num_rows <= self._num_rows:
+            return
+        with open(keys_path, "rb") as f:
+            f.seek(self._num_rows * _KEY_BYTES)
+            new_keys = f.read((num_rows - self._num_rows) * _KEY_BYTES)
+        for offset in range(0, len(new_keys), _KEY_BYTES):
+            self._rows.setdefault(new_keys[offset:offset + _KEY_BYTES], self._num_rows + offset // _KEY_BYTES)
+        self._vectors = np.memmap(vectors_path, dtype=self.dtype, mode="r", shape=(num_rows, self._dim))
+        self._num_rows = num_rows
+
+    def _truncate_partial_writes(self):
+        """
+        Cuts both files back to the last complete (key, vector) pair. A worker
+        that died mid-append leaves vector rows without keys (or a torn key),
+        which would shift every later key onto the wrong row. Must be called
+        with the file lock held, before appending.
+        """
+        keys_path = self._path(_KEYS_FILE)
+        vectors_path = self._path(_VECTORS_FILE)
+        row_bytes = self._dim * self.dtype.itemsize
+        keys_size = os.path.getsize(keys_path) if os.path.exists(keys_path) else 0
+        vectors_size = os.path.getsize(vectors_path) if os.path.exists(vectors_path) else 0
+        num_rows = min(keys_size // _KEY_BYTES, vectors_size // row_bytes)
+        for path, size, expected in ((keys_path, keys_size, num_rows * _KEY_BYTES),
+                                     (vectors_path, vectors_size, num_rows * row_bytes)):
+            if size > expected:
+                logger.warning(f"Truncating {size - expected} bytes of an incomplete append from {path}")
+                os.truncate(path, expected)
+
+    def _append(self, keys, vectors: np.ndarray):
+        with open(self._path(_LOCK_FILE), "a") as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                with self._lock:
+                    if self._dim is None:
+                        self._load_meta()
+                    if self._dim is None:
+                        self._dim = int(vectors.shape[1])
+                        with open(self._path(_META_FILE), "w") as f:
+                            json.dump({"model_name": self.model_name, "dim": self._dim, "dtype": self.dtype.name}, f)
+                    self._truncate_partial_writes()
+                    self._refresh()
+                    # Another worker may have appended the same texts meanwhile
+                    fresh = [i for i, key in enumerate(keys) if key not in self._rows]
+                    if not fresh:
+                        return
+                    with open(self._path(_VECTORS_FILE), "ab") as f:
+                        f.write(np.ascontiguousarray(vectors[fresh], dtype=self.dtype).tobytes())
+                        f.flush()
+                        os.fsync(f.fileno())
+                    with open(self._path(_KEYS_FILE), "ab") as f:
+                        f.write(b"".join(keys[i] for i in fresh))
+                    self._refresh()
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def embed_documents(self, texts, embed_fn):
+        """
+        Returns embeddings for ``texts``, calling ``embed_fn`` only for texts
+        that are not cached yet (each unique text at most once).
+        """
+        keys = [self.key(text) for text in texts]
+        with self._lock:
+            self._refresh()
+            found = {key: self._rows[key] for key in set(keys) if key in self._rows}
+            vectors = self._vectors
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+
+        computed = {}
+        if missing:
+            missing_keys = list(missing)
+            new_vectors = np.asarray(embed_fn([missing[key] for key in missing_keys]), dtype=np.float32)
+            self._append(missing_keys, new_vectors)
+            computed = dict(zip(missing_keys, new_vectors))
+
+        with self._lock:
+            self.hits += sum(1 for key in keys if key in found)
+            self.misses += sum(1 for key in keys if key not in found)
+        return [
+            (np.asarray(vectors[found[key]], dtype=np.float32) if key in found else computed[key]).tolist()
+            for key in keys
+        ]
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            bytes_on_disk = sum(
+                os.path.getsize(self._path(name)) for name in (_VECTORS_FILE, _KEYS_FILE, _META_FILE)
+                if os.path.exists(self._path(name)))
+            return {
+                "model_name": self.model_name,
+                "entries": self._num_rows,
+                "dtype": self.dtype.name,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "bytes_on_disk": bytes_on_disk,
+            }
@@ -0,0 +1,352 @@
+import os
+import re
+import math
+import logging
+import threading
+import weakref
+from datetime import datetime, timezone
+from typing import Any, Callable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from model_registry import registry
+from metrics import span
+
+logger = logging.getLogger(__name__)
+
+# Fuse a per-ASIN BM25 keyword index with the vector results; set to false for vector-only retrieval
+HYBRID_RETRIEVAL = os.getenv("HYBRID_RETRIEVAL", "true").lower() in ("1", "true", "yes")
+# Candidates taken from each retriever before fusion and reranking
+VECTOR_CANDIDATES = int(os.getenv("VECTOR_CANDIDATES", "20"))
+BM25_CANDIDATES = int(os.getenv("BM25_CANDIDATES", "20"))
+# Documents kept after reranking (before the token budget is applied)
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "8"))
+# Approximate token budget for the review context placed in the prompt
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1200"))
+# Metadata fields rendered into the prompt; the rest stays in the API sources
+CONTEXT_METADATA_FIELDS = ("rating", "verified_purchase", "helpful_vote", "timestamp", "title")
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have i if in is it its of on or so that the this to was were "
+    "with my me we you your they their what which who how does do did not no".split())
+# Reciprocal rank fusion constant; larger values flatten the rank weighting
+_RRF_K = 60
+# Rough characters-per-token ratio of English text for budget estimates
+_CHARS_PER_TOKEN = 4
+
+
+def tokenize(text: str) -> list:
+    return [token for token in _TOKEN_PATTERN.findall(str(text).lower()) if token not in _STOPWORDS]
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / _CHARS_PER_TOKEN)
+
+
+class BM25Index:
+    """
+    In-memory Okapi BM25 inverted index over one ASIN's reviews.
+
+    Postings are stored as flat numpy arrays grouped by term, with the BM25
+    weight of each (term, document) pair precomputed, so scoring a query is
+    one slice per query term and a single bincount.
+    """
+
+    def __init__(self, doc_ids, texts, k1: float = 1.5, b: float = 0.75):
+        self.doc_ids = list(doc_ids)
+        vocabulary = {}
+        posting_terms, posting_docs, posting_tf = [], [], []
+        doc_lengths = np.zeros(len(self.doc_ids), dtype=np.float32)
+        for doc, text in enumerate(texts):
+            tokens = tokenize(text)
+            doc_lengths[doc] = len(tokens)
+            counts = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, count in counts.items():
+                posting_terms.append(vocabulary.setdefault(token, len(vocabulary)))
+                posting_docs.append(doc)
+                posting_tf.append(count)
+
+        self.vocabulary = vocabulary
+        terms = np.asarray(posting_terms, dtype=np.int64)
+        docs = np.asarray(posting_docs, dtype=np.int64)
+        tf = np.asarray(posting_tf, dtype=np.float32)
+        order = np.argsort(terms, kind="stable")
+        terms, docs, tf = terms[order], docs[order], tf[order]
+
+        num_docs = max(len(self.doc_ids), 1)
+        doc_freq = np.bincount(terms, minlength=len(vocabulary)).astype(np.float32)
+        idf = np.log1p((num_docs - doc_freq + 0.5) / (doc_freq + 0.5))
+        avg_length = float(doc_lengths.mean()) if len(doc_lengths) and doc_lengths.mean() > 0 else 1.0
+        norm = k1 * (1 - b + b * doc_lengths[docs] / avg_length)
+        self.weights = idf[terms] * tf * (k1 + 1) / (tf + norm)
+        self.docs = docs
+        self.offsets = np.concatenate(([0], np.cumsum(doc_freq.astype(np.int64))))
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    def search(self, query: str, k: int) -> list:
+        """
+        Returns up to ``k`` (doc_id, score) pairs with a positive score, best first.
+        """
+        term_ids = {self.vocabulary[token] for token in tokenize(query) if token in self.vocabulary}
+        if not term_ids or not self.doc_ids:
+            return []
+        postings = np.concatenate([np.arange(self.offsets[t], self.offsets[t + 1]) for t in term_ids])
+        scores = np.bincount(self.docs[postings], weights=self.weights[postings], minlength=len(self.doc_ids))
+        k = min(k, int(np.count_nonzero(scores)))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.doc_ids[i], float(scores[i])) for i in top]
+
+
+def build_bm25_index(vectordb, excluded_ids=()) -> BM25Index:
+    """
+    BM25 index over the documents of a FAISS vector store (docstore ids are review ids).
+    """
+    excluded_ids = set(excluded_ids)
+    doc_ids, texts = [], []
+    for doc_id in vectordb.index_to_docstore_id.values():
+        if doc_id in excluded_ids:
+            continue
+        doc = vectordb.docstore.search(doc_id)
+        if hasattr(doc, "page_content"):
+            doc_ids.append(doc_id)
+            texts.append(doc.page_content)
+    return BM25Index(doc_ids, texts)
+
+
+_shared_bm25 = weakref.WeakKeyDictionary()
+_shared_bm25_lock = threading.Lock()
+
+
+def shared_bm25_index(vectordb) -> BM25Index:
+    """
+    BM25 index over every document of ``vectordb``, built once per store and
+    shared by all retrievers over it; the store must not change afterwards.
+    """
+    with _shared_bm25_lock:
+        bm25 = _shared_bm25.get(vectordb)
+    if bm25 is None:
+        with span("bm25_build"):
+            bm25 = build_bm25_index(vectordb)
+        with _shared_bm25_lock:
+            bm25 = _shared_bm25.setdefault(vectordb, bm25)
+    return bm25
+
+
+def reciprocal_rank_fusion(*ranked_lists) -> list:
+    """
+    Merges ranked id lists into (id, fused score) pairs, best first; ids
+    ranked high by several retrievers come first.
+    """
+    scores = {}
+    for ranked in ranked_lists:
+        for rank, doc_id in enumerate(ranked):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (_RRF_K + rank + 1)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+def rerank_documents(query: str, scored: list) -> list:
+    """
+    Reorders (doc, score) pairs by the local cross-encoder, replacing the
+    scores with reranker scores. Without a reranker the input is returned.
+    """
+    if not scored:
+        return scored
+    with span("rerank"):
+        scores = registry.rerank(query, [doc.page_content for doc, _ in scored])
+    if scores is None:
+        return scored
+    order = np.argsort(-np.asarray(scores, dtype=np.float32), kind="stable")
+    return [(scored[i][0], float(scores[i])) for i in order]
+
+
+def _format_metadata(metadata: dict, include_asin: bool = False) -> str:
+    parts = []
+    if include_asin and metadata.get("parent_asin"):
+        parts.append(f"ASIN: {metadata['parent_asin']}")
+    rating = metadata.get("rating")
+    if rating is not None and not pd.isna(rating):
+        parts.append(f"Rating: {float(rating):g}/5")
+    if metadata.get("verified_purchase") is True:
+        parts.append("Verified purchase")
+    votes = metadata.get("helpful_vote")
+    if votes is not None and not pd.isna(votes) and int(votes) > 0:
+        parts.append(f"Helpful votes: {int(votes)}")
+    timestamp = metadata.get("timestamp")
+    if isinstance(timestamp, (int, float, np.integer, np.floating)) and not pd.isna(timestamp):
+        # Review timestamps are epoch milliseconds
+        parts.append(datetime.fromtimestamp(int(timestamp) / 1000, tz=timezone.utc).strftime("%Y-%m-%d"))
+    header = " | ".join(parts)
+    title = metadata.get("title")
+    if isinstance(title, str) and title.strip():
+        header = f"{header}\nTitle: {title.strip()}" if header else f"Title: {title.strip()}"
+    return header
+
+
+def pack_documents(docs, max_tokens: int = None, include_asin: bool = False) -> list:
+    """
+    Renders each document as a compact review (text plus the metadata fields
+    in CONTEXT_METADATA_FIELDS, and the ASIN with ``include_asin``) and keeps
+    documents, in order, until the approximate token budget is used up. A
+    document that does not fit is truncated when a useful part of the budget
+    is left. The original metadata is kept on the returned documents for the
+    API sources.
+    """
+    from langchain_core.documents import Document
+
+    max_tokens = CONTEXT_TOKEN_BUDGET if max_tokens is None else max_tokens
+    packed, used = [], 0
+    for doc in docs:
+        header = _format_metadata(doc.metadata, include_asin=include_asin)
+        text = f"{header}\n{doc.page_content}" if header else doc.page_content
+        cost = estimate_tokens(text)
+        if used + cost > max_tokens:
+            remaining = max_tokens - used
+            if remaining < 32 and packed:
+                break
+            text = text[:max(remaining, 0) * _CHARS_PER_TOKEN].rsplit(" ", 1)[0] + " ..."
+            cost = estimate_tokens(text)
+        packed.append(Document(page_content=text, metadata=doc.metadata))
+        used += cost
+        if used >= max_tokens:
+            break
+    return packed
+
+
+def _hybrid_retriever_class():
+    # Defined lazily so importing this module does not import LangChain
+    from langchain_core.callbacks import CallbackManagerForRetrieverRun
+    from langchain_core.retrievers import BaseRetriever
+    from pydantic import ConfigDict, PrivateAttr
+
+    class HybridRetriever(BaseRetriever):
+        """
+        Vector + BM25 retriever for one ASIN: fuses both candidate lists with
+        reciprocal rank fusion, reranks the fused candidates with the local
+        cross-encoder (when configured) and packs the best ones into the
+        context token budget.
+        """
+
+        model_config = ConfigDict(arbitrary_types_allowed=True)
+
+        vectorstore: Any
+        # Small store of reviews added since ``vectorstore`` was built; searched alongside it
+        delta_store: Any = None
+        search_filter: Optional[Callable] = None
+        excluded_ids: frozenset = frozenset()
+        use_bm25: bool = HYBRID_RETRIEVAL
+        vector_k: int = VECTOR_CANDIDATES
+        bm25_k: int = BM25_CANDIDATES
+        top_k: int = RETRIEVAL_TOP_K
+        max_tokens: int = CONTEXT_TOKEN_BUDGET
+
+        _delta_bm25: Any = PrivateAttr(default=None)
+        _bm25_lock: Any = PrivateAttr(default_factory=threading.Lock)
+
+        @property
+        def bm25(self) -> BM25Index:
+            # Built on first search, which runs off the event loop, and reused
+            # by the retrievers of later refreshes over the same store
+            return shared_bm25_index(self.vectorstore)
+
+        @property
+        def delta_bm25(self) -> Optional[BM25Index]:
+            if self.delta_store is None:
+                return None
+            if self._delta_bm25 is None:
+                with self._bm25_lock:
+                    if self._delta_bm25 is None:
+                        self._delta_bm25 = build_bm25_index(self.delta_store)
+            return self._delta_bm25
+
+        def document(self, doc_id):
+            """
+            The document stored under ``doc_id`` in the delta or the main store.
+            """
+            if self.delta_store is not None:
+                doc = self.delta_store.docstore.search(doc_id)
+                # InMemoryDocstore returns a "not found" string for unknown ids
+                if hasattr(doc, "page_content"):
+                    return doc
+            return self.vectorstore.docstore.search(doc_id)
+
+        def _vector_search(self, query_vector) -> list:
+            fetch_k = max(2 * self.vector_k, self.vector_k + len(self.excluded_ids))
+            scored = self.vectorstore.similarity_search_with_score_by_vector(
+                query_vector, k=self.vector_k, filter=self.search_filter, fetch_k=fetch_k)
+            if self.delta_store is not None:
+                # Both stores use L2 distance, so their results merge by score
+                scored += self.delta_store.similarity_search_with_score_by_vector(query_vector, k=self.vector_k)
+                scored.sort(key=lambda pair: pair[1])
+            return [doc for doc, _ in scored[:self.vector_k]]
+
+        def _keyword_search(self, query: str, bm25: BM25Index, delta_bm25: Optional[BM25Index]) -> list:
+            # Tombstoned reviews are still in the shared index; fetch enough to drop them
+            hits = bm25.search(query, self.bm25_k + len(self.excluded_ids))
+            if delta_bm25 is not None:
+                # Scores of the two indexes are only roughly comparable (separate IDF statistics)
+                hits += delta_bm25.search(query, self.bm25_k)
+                hits.sort(key=lambda hit: hit[1], reverse=True)
+            return [doc_id for doc_id, _ in hits if doc_id not in self.excluded_ids][:self.bm25_k]
+
+        def candidates(self, query: str, query_vector=None) -> list:
+            """
+            Fused vector + BM25 candidates for ``query`` as (doc, fused score)
+            pairs, best first, before reranking; pass a precomputed
+            ``query_vector`` to skip embedding the query.
+            """
+            if query_vector is None:
+                with span("embed_query"):
+                    query_vector = self.vectorstore.embedding_function.embed_query(query)
+            with span("vector_search"):
+                vector_docs = self._vector_search(query_vector)
+            by_id = {doc.metadata.get("review_id", doc.page_content): doc for doc in vector_docs}
+            ranked = [list(by_id)]
+
+            if self.use_bm25:
+                # Built on first use, outside the search timing
+                bm25, delta_bm25 = self.bm25, self.delta_bm25
+                with span("bm25_search"):
+                    keyword_ids = self._keyword_search(query, bm25, delta_bm25)
+                for doc_id in keyword_ids:
+                    if doc_id not in by_id:
+                        by_id[doc_id] = self.document(doc_id)
+                ranked.append(keyword_ids)
+            return [(by_id[doc_id], score) for doc_id, score in reciprocal_rank_fusion(*ranked)]
+
+        def retrieve(self, query: str, query_vector=None) -> list:
+            """
+            Retrieves, fuses, reranks and packs documents for ``query``.
+            """
+            scored = rerank_documents(query, self.candidates(query, query_vector))
+            with span("context_packing"):
+                return pack_documents([doc for doc, _ in scored[:self.top_k]], self.max_tokens)
+
+        def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List:
+            return self.retrieve(query)
+
+    return HybridRetriever
+
+
+_HybridRetriever = None
+
+
+def create_hybrid_retriever(vectorstore, search_filter=None, excluded_ids=(), delta_store=None, **kwargs):
+    """
+    Returns a HybridRetriever over ``vectorstore`` (and ``delta_store``, if
+    given); ``search_filter`` and ``excluded_ids`` hide tombstoned reviews of
+    ``vectorstore`` from the vector and BM25 results.
+    """
+    global _HybridRetriever
+    if _HybridRetriever is None:
+        _HybridRetriever = _hybrid_retriever_class()
+    return _HybridRetriever(vectorstore=vectorstore, delta_store=delta_store, search_filter=search_filter,
+                            excluded_ids=frozenset(excluded_ids), **kwargs)
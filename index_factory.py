@@ -0,0 +1,152 @@
+import os
+import math
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# "auto" picks by corpus size; "flat", "hnsw" or "ivf" forces one type
+INDEX_KIND = os.getenv("INDEX_KIND", "auto")
+# Corpora up to this size use an exact flat index
+INDEX_FLAT_MAX_DOCS = int(os.getenv("INDEX_FLAT_MAX_DOCS", "20000"))
+# Corpora up to this size use HNSW; larger ones use IVF
+INDEX_HNSW_MAX_DOCS = int(os.getenv("INDEX_HNSW_MAX_DOCS", "500000"))
+INDEX_HNSW_M = int(os.getenv("INDEX_HNSW_M", "32"))
+INDEX_HNSW_EF_CONSTRUCTION = int(os.getenv("INDEX_HNSW_EF_CONSTRUCTION", "80"))
+INDEX_HNSW_EF_SEARCH = int(os.getenv("INDEX_HNSW_EF_SEARCH", "64"))
+# 0 means 4 * sqrt(n) lists
+INDEX_IVF_NLIST = int(os.getenv("INDEX_IVF_NLIST", "0"))
+INDEX_IVF_NPROBE = int(os.getenv("INDEX_IVF_NPROBE", "16"))
+# "none", "sq8" (8-bit scalar quantization, 4x smaller) or "pq" (product quantization)
+INDEX_QUANTIZATION = os.getenv("INDEX_QUANTIZATION", "none")
+INDEX_PQ_M = int(os.getenv("INDEX_PQ_M", "16"))
+# Each PQ sub-quantizer has 2^8 centroids and needs at least as many training vectors
+PQ_MIN_TRAIN_DOCS = 256
+# Vectors sampled to train IVF/PQ codebooks
+INDEX_TRAIN_SAMPLE = int(os.getenv("INDEX_TRAIN_SAMPLE", "100000"))
+
+
+def choose_index_kind(num_docs: int, kind: str = None) -> str:
+    """
+    Index type for a corpus of ``num_docs`` vectors: exact flat search for
+    small corpora, HNSW for medium ones and IVF for very large ones.
+    """
+    kind = (kind or INDEX_KIND).lower()
+    if kind != "auto":
+        return kind
+    if num_docs <= INDEX_FLAT_MAX_DOCS:
+        return "flat"
+    if num_docs <= INDEX_HNSW_MAX_DOCS:
+        return "hnsw"
+    return "ivf"
+
+
+def _pq_m(dim: int) -> int:
+    # The number of sub-quantizers must divide the dimension
+    m = min(INDEX_PQ_M, dim)
+    while dim % m:
+        m -= 1
+    return m
+
+
+def build_faiss_index(vectors: np.ndarray, kind: str = None, quantization: str = None):
+    """
+    Creates (and trains, if needed) an empty L2 FAISS index sized for
+    ``vectors``; the caller adds the vectors. Quantization only applies to
+    the approximate index types and to flat indexes of forced kinds; "pq"
+    falls back to "sq8" for corpora too small to train its codebooks.
+    """
+    import faiss
+
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    num_docs, dim = vectors.shape
+    auto = (kind or INDEX_KIND).lower() == "auto"
+    kind = choose_index_kind(num_docs, kind)
+    quantization = (quantization or INDEX_QUANTIZATION).lower()
+    if kind == "flat" and auto:
+        # Small corpora are cheap to search exactly and too small to compress much
+        quantization = "none"
+    elif quantization == "pq" and num_docs < PQ_MIN_TRAIN_DOCS:
+        logger.info(f"{num_docs} vectors are too few to train PQ; using sq8 instead")
+        quantization = "sq8"
+
+    if kind == "flat":
+        if quantization == "sq8":
+            index = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit)
+        elif quantization == "pq":
+            index = faiss.IndexPQ(dim, _pq_m(dim), 8)
+        else:
+            index = faiss.IndexFlatL2(dim)
+    elif kind == "hnsw":
+        if quantization == "sq8":
+            index = faiss.IndexHNSWSQ(dim, faiss.ScalarQuantizer.QT_8bit, INDEX_HNSW_M)
+        elif quantization == "pq":
+            index = faiss.IndexHNSWPQ(dim, _pq_m(dim), INDEX_HNSW_M)
+        else:
+            index = faiss.IndexHNSWFlat(dim, INDEX_HNSW_M)
+        index.hnsw.efConstruction = INDEX_HNSW_EF_CONSTRUCTION
+    elif kind == "ivf":
+        nlist = INDEX_IVF_NLIST or max(1, int(4 * math.sqrt(num_docs)))
+        # Each list needs enough training points
+        nlist = max(1, min(nlist, num_docs // 39 or 1))
+        quantizer = faiss.IndexFlatL2(dim)
+        if quantization == "sq8":
+            index = faiss.IndexIVFScalarQuantizer(quantizer, dim, nlist, faiss.ScalarQuantizer.QT_8bit)
+        elif quantization == "pq":
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, _pq_m(dim), 8)
+        else:
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist)
+    else:
+        raise ValueError(f"Unknown index kind: {kind!r} (expected 'auto', 'flat', 'hnsw' or 'ivf')")
+
+    if not index.is_trained:
+        if len(vectors) > INDEX_TRAIN_SAMPLE:
+            sample = np.random.default_rng(0).choice(len(vectors), INDEX_TRAIN_SAMPLE, replace=False)
+            index.train(vectors[sample])
+        else:
+            index.train(vectors)
+    apply_search_params(index)
+    logger.info(f"Selected {kind} index (quantization={quantization}) for {num_docs} vectors")
+    return index
+
+
+def apply_search_params(index):
+    """
+    Sets the query-time knobs (HNSW efSearch, IVF nprobe); they are not
+    reliably restored when an index is read back from disk.
+    """
+    import faiss
+
+    if hasattr(index, "hnsw"):
+        index.hnsw.efSearch = INDEX_HNSW_EF_SEARCH
+    if is_ivf(index):
+        faiss.extract_index_ivf(index).nprobe = INDEX_IVF_NPROBE
+    return index
+
+
+def is_ivf(index) -> bool:
+    import faiss
+
+    try:
+        return faiss.extract_index_ivf(index) is not None
+    except RuntimeError:
+        return False
+
+
+def copy_index(index):
+    """
+    Private, writable copy of ``index``. Unlike faiss.clone_index this also
+    works for memory-mapped indexes, whose clones still point at the mapped
+    file and abort on the first add or remove.
+    """
+    import faiss
+
+    return faiss.deserialize_index(faiss.serialize_index(index))
+
+
+def describe_index(index) -> dict:
+    """
+    Type and size of an index, for logging and stats.
+    """
+    return {"type": type(index).__name__, "ntotal": int(index.ntotal), "dim": int(index.d)}
@@ -0,0 +1,135 @@
+import os
+import re
+import json
+import time
+import fcntl
+import shutil
+import pickle
+import logging
+from contextlib import contextmanager
+
+from index_factory import apply_search_params, is_ivf
+
+logger = logging.getLogger(__name__)
+
+_SAFE_KEY = re.compile(r"^[A-Za-z0-9_-]+$")
+_INDEX_FILE = "index.faiss"
+_DOCSTORE_FILE = "index.pkl"
+_STATE_FILE = "state.json"
+
+
+def _read_index(index_path: str):
+    """
+    Opens a saved FAISS index read-only. Flat and scalar/product-quantized
+    codes (including the storage of HNSW indexes) are memory-mapped with
+    IO_FLAG_MMAP_IFC, so workers share the file's pages. IVF indexes and
+    types faiss cannot map are read into private memory.
+    """
+    import faiss
+
+    mmap_flag = getattr(faiss, "IO_FLAG_MMAP_IFC", None)
+    if mmap_flag is not None:
+        try:
+            index = faiss.read_index(index_path, mmap_flag | faiss.IO_FLAG_READ_ONLY)
+            # IVF lists would be mapped as views that even a copy cannot modify
+            if not is_ivf(index):
+                return index
+        except RuntimeError as e:
+            logger.info(f"Cannot memory-map {index_path} ({e}); reading it into memory")
+    return faiss.read_index(index_path)
+
+
+class FaissIndexStore:
+    """
+    On-disk store of per-ASIN FAISS indexes shared by all uvicorn workers.
+
+    Each saved index is an immutable version directory
+    ``<root>/<asin>/v<ns-timestamp>/`` holding the FAISS index, its docstore
+    and a state file (review high-water mark and review ids). Workers open
+    the latest version read-only with FAISS memory mapping (see _read_index),
+    so every worker maps the same file pages through the OS page cache
+    instead of holding its own copy. A per-ASIN file lock ensures only one worker builds or
+    refreshes an ASIN at a time.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(self.root, exist_ok=True)
+
+    def _asin_dir(self, asin: str) -> str:
+        if not _SAFE_KEY.match(asin):
+            raise ValueError(f"Invalid ASIN for index store: {asin!r}")
+        return os.path.join(self.root, asin)
+
+    @contextmanager
+    def lock(self, asin: str):
+        """
+        Exclusive advisory lock for one ASIN, shared by every process on this host.
+        """
+        self._asin_dir(asin)
+        with open(os.path.join(self.root, f"{asin}.lock"), "a") as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _latest_version(self, asin: str):
+        asin_dir = self._asin_dir(asin)
+        if not os.path.isdir(asin_dir):
+            return None
+        versions = sorted(name for name in os.listdir(asin_dir)
+                          if name.startswith("v") and os.path.exists(os.path.join(asin_dir, name, _STATE_FILE)))
+        return os.path.join(asin_dir, versions[-1]) if versions else None
+
+    def latest_version(self, asin: str):
+        """
+        Name of the newest saved version for ``asin``, or None.
+        """
+        version_dir = self._latest_version(asin)
+        return os.path.basename(version_dir) if version_dir else None
+
+    def load(self, asin: str, embeddings):
+        """
+        Opens the newest saved index for ``asin``.
+        Returns (vectordb, state, version) or None when nothing is saved.
+        """
+        version_dir = self._latest_version(asin)
+        if version_dir is None:
+            return None
+        with open(os.path.join(version_dir, _STATE_FILE)) as f:
+            state = json.load(f)
+        return self._open(version_dir, embeddings), state, os.path.basename(version_dir)
+
+    def save(self, asin: str, vectordb, state: dict) -> str:
+        """
+        Persists ``vectordb`` and its ``state`` as a new version and removes
+        superseded ones. Call with lock(asin) held. Returns the version name.
+        """
+        start = time.perf_counter()
+        asin_dir = self._asin_dir(asin)
+        os.makedirs(asin_dir, exist_ok=True)
+        version = f"v{time.time_ns()}"
+        tmp_dir = os.path.join(asin_dir, f".tmp-{version}-{os.getpid()}")
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        vectordb.save_local(tmp_dir)
+        with open(os.path.join(tmp_dir, _STATE_FILE), "w") as f:
+            json.dump(state, f)
+        # Publish atomically, then drop superseded versions. Workers that still
+        # have an old version mapped keep it alive until they unmap it.
+        os.rename(tmp_dir, os.path.join(asin_dir, version))
+        for name in os.listdir(asin_dir):
+            if name != version:
+                shutil.rmtree(os.path.join(asin_dir, name), ignore_errors=True)
+        logger.info(f"Persisted FAISS index for ASIN {asin} ({version}) in {time.perf_counter() - start:.2f}s")
+        return version
+
+    def _open(self, version_dir: str, embeddings):
+        from langchain_community.vectorstores import FAISS
+
+        index = _read_index(os.path.join(version_dir, _INDEX_FILE))
+        apply_search_params(index)
+        with open(os.path.join(version_dir, _DOCSTORE_FILE), "rb") as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+        return FAISS(embedding_function=embeddings, index=index, docstore=docstore,
+                     index_to_docstore_id=index_to_docstore_id)
@@ -0,0 +1,98 @@
+"""
+Ingests a review / metadata dump into the local Parquet snapshot served by
+data_sources.ParquetSource.
+
+Inputs may be a BigQuery export or any Parquet or JSONL dump (files or
+directories). Rows are streamed into a dataset hive-partitioned by
+parent_asin, so the input never has to fit in memory.
+
+Example:
+    python ingest_snapshot.py --reviews exports/reviews/ --metadata exports/meta.jsonl \
+        --out data/snapshot
+"""
+import os
+import argparse
+import logging
+
+from data_sources import REVIEWS_DATASET, METADATA_DATASET, PARTITION_COLUMN
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def _input_files(paths) -> list:
+    """
+    Expands directories in ``paths`` into the files under them (skipping
+    hidden and "_"-prefixed ones such as _SUCCESS, like pyarrow does);
+    pyarrow only accepts a directory as the sole input, not in a list.
+    """
+    files = []
+    for path in paths:
+        if not os.path.isdir(path):
+            files.append(path)
+            continue
+        for root, dirs, names in os.walk(path):
+            dirs[:] = sorted(name for name in dirs if not name.startswith((".", "_")))
+            files.extend(os.path.join(root, name) for name in sorted(names) if not name.startswith((".", "_")))
+    if not files:
+        raise ValueError(f"No input files found in {paths}")
+    return files
+
+
+def _input_format(files) -> str:
+    """
+    Infers "parquet" or "json" from the first input file's extension.
+    """
+    if files[0].endswith((".jsonl", ".json", ".ndjson", ".jsonl.gz", ".json.gz")):
+        return "json"
+    return "parquet"
+
+
+def ingest(paths, out_dir: str, dataset_name: str, max_rows_per_file: int = 1_000_000):
+    """
+    Streams ``paths`` into ``<out_dir>/<dataset_name>/parent_asin=<asin>/``.
+    Partitions present in the input replace the existing ones; other ASINs
+    in the snapshot are left untouched.
+    """
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    files = _input_files(paths)
+    source = ds.dataset(files, format=_input_format(files))
+    if PARTITION_COLUMN not in source.schema.names:
+        raise ValueError(f"Input {paths} has no {PARTITION_COLUMN} column")
+    # Partition keys must be strings so directory names match ASIN lookups
+    columns = {name: ds.field(name) for name in source.schema.names}
+    columns[PARTITION_COLUMN] = ds.field(PARTITION_COLUMN).cast(pa.string())
+    scanner = source.scanner(columns=columns)
+    target = os.path.join(out_dir, dataset_name)
+    ds.write_dataset(
+        scanner,
+        target,
+        format="parquet",
+        partitioning=ds.partitioning(pa.schema([(PARTITION_COLUMN, pa.string())]), flavor="hive"),
+        existing_data_behavior="delete_matching",
+        max_partitions=1_000_000,
+        max_rows_per_file=max_rows_per_file,
+        max_rows_per_group=min(max_rows_per_file, 64 * 1024),
+    )
+    logger.info(f"Ingested {paths} into {target}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the local Parquet review snapshot partitioned by parent_asin.")
+    parser.add_argument("--reviews", nargs="+", help="Review dump files or directories (Parquet or JSONL).")
+    parser.add_argument("--metadata", nargs="+", help="Metadata dump files or directories (Parquet or JSONL).")
+    parser.add_argument("--out", default=os.getenv("PARQUET_DATA_ROOT", "data/snapshot"),
+                        help="Snapshot root directory (defaults to PARQUET_DATA_ROOT).")
+    args = parser.parse_args(argv)
+    if not args.reviews and not args.metadata:
+        parser.error("nothing to ingest: pass --reviews and/or --metadata")
+    if args.reviews:
+        ingest(args.reviews, args.out, REVIEWS_DATASET)
+    if args.metadata:
+        ingest(args.metadata, args.out, METADATA_DATASET)
+
+
+if __name__ == "__main__":
+    main()
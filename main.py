@@ -1,33 +1,231 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+import json
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field, model_validator
+from typing import List, Optional
 import logging
 
 # Import your chatbot function
-from chatbot_model import chatbot
-
-# FastAPI app initialization
-app = FastAPI()
+from chatbot_model import (achatbot, abatch_chat, astream_chat, amulti_asin_chat, aggregate_cache, retriever_cache,
+                           session_store, index_flight, aggregate_flight, answer_cache)
+from model_registry import registry
+import metrics
+import admission
+from admission import AdmissionError
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load the embedding model and LLM client in the background so the server
+    # binds its port immediately; /ready reports when warm-up has finished.
+    warm_up_task = asyncio.create_task(asyncio.to_thread(registry.warm_up))
+    yield
+    if not warm_up_task.done():
+        warm_up_task.cancel()
+
+# FastAPI app initialization
+app = FastAPI(lifespan=lifespan)
+
+# End-to-end latency per route for the chatbot_request_seconds histogram
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    if not metrics.METRICS_ENABLED:
+        return await call_next(request)
+    start = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    metrics.REQUEST_SECONDS.observe(time.perf_counter() - start,
+                                    path=getattr(route, "path", "unmatched"), status=response.status_code)
+    return response
+
+# Overloaded (429) and deadline (503) rejections tell the client when to retry
+@app.exception_handler(AdmissionError)
+async def admission_error_handler(request: Request, exc: AdmissionError):
+    return JSONResponse(status_code=exc.status_code, content={"detail": str(exc), "stage": exc.stage},
+                        headers={"Retry-After": str(exc.retry_after)})
+
 # Define the request structure
 class ChatRequest(BaseModel):
     asin: str
     question: str
+    # Optional client-chosen id; requests sharing it continue one conversation per ASIN
+    session_id: Optional[str] = None
+    # Return a per-stage timing breakdown with the answer (/chat/ only)
+    include_timings: bool = False
+    # Overrides REQUEST_DEADLINE_SECONDS for this request
+    deadline_seconds: Optional[float] = Field(None, gt=0, le=300)
+
+class BatchChatRequest(BaseModel):
+    asin: str
+    questions: List[str] = Field(..., min_length=1, max_length=50)
+    # Overrides BATCH_LLM_CONCURRENCY for this request
+    max_concurrency: Optional[int] = Field(None, ge=1, le=32)
+    # Overrides REQUEST_DEADLINE_SECONDS for this request
+    deadline_seconds: Optional[float] = Field(None, gt=0, le=300)
+
+class MultiChatRequest(BaseModel):
+    question: str
+    # Either a seller (all of their ASINs) or an explicit list of ASINs
+    seller_id: Optional[str] = None
+    asins: Optional[List[str]] = Field(None, min_length=1, max_length=500)
+    # Overrides MULTI_ASIN_TOP_K for this request
+    top_k: Optional[int] = Field(None, ge=1, le=50)
+    # Overrides REQUEST_DEADLINE_SECONDS for this request
+    deadline_seconds: Optional[float] = Field(None, gt=0, le=300)
+
+    @model_validator(mode="after")
+    def check_target(self):
+        if bool(self.seller_id) == bool(self.asins):
+            raise ValueError("Provide exactly one of seller_id or asins")
+        return self
 
 # API endpoint to interact with the chatbot
 @app.post("/chat/")
 async def chat_endpoint(request: ChatRequest):
+    admission.admit()
     try:
-        answer = chatbot(request.asin, request.question)
-        return {"asin": request.asin, "question": request.question, "answer": answer}
+        with admission.request_deadline(request.deadline_seconds):
+            if not request.include_timings:
+                answer = await achatbot(request.asin, request.question, session_id=request.session_id)
+                return {"asin": request.asin, "question": request.question, "answer": answer,
+                        "session_id": request.session_id}
+            start = time.perf_counter()
+            with metrics.collect_timings() as timings:
+                answer = await achatbot(request.asin, request.question, session_id=request.session_id)
+            return {"asin": request.asin, "question": request.question, "answer": answer,
+                    "session_id": request.session_id,
+                    "timings": {"stages": timings.as_dict(), "total_seconds": round(time.perf_counter() - start, 4)}}
+    except AdmissionError:
+        raise
     except Exception as e:
         logger.error(f"Error processing the request: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# Many questions against one ASIN: one retriever lookup, one batched query
+# embedding, and concurrent LLM calls
+@app.post("/chat/batch")
+async def chat_batch_endpoint(request: BatchChatRequest):
+    admission.admit()
+    start = time.perf_counter()
+    try:
+        with admission.request_deadline(request.deadline_seconds):
+            results = await abatch_chat(request.asin, request.questions, max_concurrency=request.max_concurrency)
+    except AdmissionError:
+        raise
+    except Exception as e:
+        logger.error(f"Error processing the batch request: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    if results is None:
+        raise HTTPException(status_code=404, detail="No review data found for the provided ASIN.")
+    return {"asin": request.asin, "results": results,
+            "elapsed_seconds": round(time.perf_counter() - start, 3)}
+
+# Questions across a seller's catalog or several ASINs: each ASIN's index is
+# searched as a shard and the results are merged into one answer
+@app.post("/chat/multi")
+async def chat_multi_endpoint(request: MultiChatRequest):
+    admission.admit()
+    try:
+        with admission.request_deadline(request.deadline_seconds):
+            result = await amulti_asin_chat(request.question, asins=request.asins, seller_id=request.seller_id,
+                                            top_k=request.top_k)
+    except AdmissionError:
+        raise
+    except Exception as e:
+        logger.error(f"Error processing the multi-ASIN request: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    if result is None:
+        raise HTTPException(status_code=404, detail="No review data found for the requested products.")
+    return {"seller_id": request.seller_id, "question": request.question, **result}
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+# Streaming variant of /chat/: Server-Sent Events with the retrieved sources first,
+# then LLM tokens as they are generated, then a final "done" summary frame
+@app.post("/chat/stream")
+async def chat_stream_endpoint(request: ChatRequest, http_request: Request):
+    # Rejected before the stream starts, so the client still gets a 429 status
+    admission.admit()
+
+    async def event_stream():
+        events = astream_chat(request.asin, request.question, session_id=request.session_id)
+        try:
+            with admission.request_deadline(request.deadline_seconds):
+                async for event in events:
+                    # Stop generating (and cancel the LLM call) once the client is gone
+                    if await http_request.is_disconnected():
+                        logger.info("Client disconnected; cancelling streamed answer.")
+                        break
+                    yield _sse(event["event"], event["data"])
+        except AdmissionError as e:
+            logger.warning(f"Streamed answer rejected: {str(e)}")
+            yield _sse("error", {"detail": str(e), "stage": e.stage, "retry_after": e.retry_after})
+        except Exception as e:
+            logger.error(f"Error streaming the response: {str(e)}")
+            yield _sse("error", {"detail": str(e)})
+        finally:
+            await events.aclose()
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# Readiness probe: 200 once the models are loaded, 503 while warming up or after a failed warm-up
+@app.get("/ready")
+async def ready():
+    if registry.ready:
+        return {"status": "ready"}
+    status = "error" if registry.warm_up_error else "warming_up"
+    return JSONResponse(status_code=503, content={"status": status, "error": registry.warm_up_error})
+
+# Hit/miss/eviction counters for the per-ASIN retriever cache
+@app.get("/cache/stats")
+async def cache_stats():
+    stats = {"retriever": retriever_cache.stats(), "aggregates": aggregate_cache.stats(),
+             "sessions": session_store.stats(), "answers": answer_cache.stats(),
+             "coalescing": {"index_build": index_flight.stats(), "aggregates": aggregate_flight.stats()}}
+    if registry.embedding_cache is not None:
+        stats["embeddings"] = registry.embedding_cache.stats()
+    return stats
+
+# Queue depth, in-flight calls, wait times and rejections per admission stage
+@app.get("/admission/stats")
+async def admission_stats():
+    return admission.stats()
+
+def _cache_samples(stats: dict, name: str):
+    return [({"cache": name, "result": "hit"}, stats.get("hits", 0)),
+            ({"cache": name, "result": "miss"}, stats.get("misses", 0))]
+
+# Prometheus scrape target: stage latency histograms, token/review counters,
+# and cache and coalescing counters read from their stats at scrape time
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    lines = metrics.render_metrics()
+    lookups = (_cache_samples(retriever_cache.stats(), "retriever") + _cache_samples(aggregate_cache.stats(), "aggregates")
+               + _cache_samples(answer_cache.stats(), "answers"))
+    if registry.embedding_cache is not None:
+        lookups += _cache_samples(registry.embedding_cache.stats(), "embeddings")
+    lines += metrics.render_samples("chatbot_cache_lookups_total", "counter", "Cache lookups by cache and result.",
+                                    lookups)
+    lines += metrics.render_samples("chatbot_cache_entries", "gauge", "Entries held per cache.", [
+        ({"cache": "retriever"}, len(retriever_cache)), ({"cache": "aggregates"}, len(aggregate_cache)),
+        ({"cache": "answers"}, answer_cache.stats()["asins"])])
+    coalescing = [index_flight.stats(), aggregate_flight.stats()]
+    lines += metrics.render_samples("chatbot_coalesced_requests_total", "counter",
+                                    "Calls that waited for an identical in-flight call.",
+                                    [({"flight": stats["name"]}, stats["coalesced"]) for stats in coalescing])
+    lines += metrics.render_samples("chatbot_active_sessions", "gauge", "Live chat sessions.",
+                                    [({}, session_store.stats()["size"])])
+    lines += admission.render_metrics()
+    return PlainTextResponse("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("main:app", host="0.0.0.0", port=8080, reload=True)
-
@@ -0,0 +1,280 @@
+import os
+import time
+import threading
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+logger = logging.getLogger(__name__)
+
+# Record per-stage latency histograms and pipeline counters for GET /metrics.
+# Per-request timing breakdowns work either way.
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+COUNT_BUCKETS = (10, 50, 100, 500, 1000, 5000, 10000, 50000, 100000, 500000)
+# Rough characters-per-token ratio used when the LLM does not report token usage
+_CHARS_PER_TOKEN = 4
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(f'{name}="{str(value)}"' for name, value in labels.items())
+    return "{" + pairs + "}"
+
+
+def render_samples(name: str, kind: str, help_text: str, samples) -> list:
+    """
+    Prometheus text-format lines for one metric; ``samples`` are (labels, value) pairs.
+    """
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    lines += [f"{name}{_format_labels(labels)} {float(value):g}" for labels, value in samples]
+    return lines
+
+
+class Counter:
+    """
+    Monotonic counter with optional labels.
+    """
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help_text = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list:
+        with self._lock:
+            samples = [(dict(key), value) for key, value in self._values.items()]
+        return render_samples(self.name, "counter", self.help_text, samples)
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram with optional labels, as Prometheus expects.
+    """
+
+    def __init__(self, name: str, help_text: str, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0, 0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += 1
+            series[2] += value
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = [(dict(key), list(counts), count, total) for key, (counts, count, total) in self._series.items()]
+        for labels, counts, count, total in series:
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f"{self.name}_bucket{_format_labels({**labels, 'le': f'{bound:g}'})} {bucket_count}")
+            lines.append(f"{self.name}_bucket{_format_labels({**labels, 'le': '+Inf'})} {count}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {total:g}")
+        return lines
+
+
+STAGE_SECONDS = Histogram("chatbot_stage_seconds", "Latency of each chat pipeline stage.")
+REQUEST_SECONDS = Histogram("chatbot_request_seconds", "End-to-end latency of API requests.")
+REVIEWS_FETCHED = Histogram("chatbot_reviews_fetched", "Reviews returned per review fetch.", COUNT_BUCKETS)
+REVIEWS_INDEXED = Counter("chatbot_reviews_indexed_total", "Reviews embedded into FAISS indexes.")
+LLM_TOKENS = Counter("chatbot_llm_tokens_total", "LLM tokens sent (in) and generated (out).")
+LLM_CALLS = Counter("chatbot_llm_calls_total", "LLM calls by outcome.")
+FAST_PATH_ANSWERS = Counter("chatbot_fast_path_answers_total",
+                            "Questions answered without the LLM, by source (aggregates, answer_cache).")
+
+_METRICS = [STAGE_SECONDS, REQUEST_SECONDS, REVIEWS_FETCHED, REVIEWS_INDEXED, LLM_TOKENS, LLM_CALLS, FAST_PATH_ANSWERS]
+
+
+class RequestTimings:
+    """
+    Per-request timing breakdown: total seconds and call count per stage.
+    Stages may run in worker threads, so updates are locked.
+    """
+
+    def __init__(self):
+        self._stages = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float):
+        with self._lock:
+            total, calls = self._stages.get(stage, (0.0, 0))
+            self._stages[stage] = (total + seconds, calls + 1)
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return {stage: {"seconds": round(total, 4), "calls": calls}
+                    for stage, (total, calls) in self._stages.items()}
+
+
+_request_timings = ContextVar("request_timings", default=None)
+
+
+@contextmanager
+def collect_timings():
+    """
+    Collects the stage timings of everything run in this context (including
+    executor work started with a copied context) into a RequestTimings.
+    """
+    timings = RequestTimings()
+    token = _request_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _request_timings.reset(token)
+
+
+class _Span:
+    __slots__ = ("stage", "timings", "start")
+
+    def __init__(self, stage: str, timings):
+        self.stage = stage
+        self.timings = timings
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.start
+        if METRICS_ENABLED:
+            STAGE_SECONDS.observe(elapsed, stage=self.stage)
+        if self.timings is not None:
+            self.timings.add(self.stage, elapsed)
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(stage: str):
+    """
+    Times a pipeline stage: ``with span("retrieval"): ...``. With metrics
+    disabled and no timing breakdown requested this is a shared no-op.
+    """
+    timings = _request_timings.get()
+    if not METRICS_ENABLED and timings is None:
+        return _NULL_SPAN
+    return _Span(stage, timings)
+
+
+def count(counter, amount: float = 1, **labels):
+    if METRICS_ENABLED:
+        counter.inc(amount, **labels)
+
+
+def observe(histogram, value: float, **labels):
+    if METRICS_ENABLED:
+        histogram.observe(value, **labels)
+
+
+def _estimate_tokens(text: str) -> int:
+    return -(-len(text) // _CHARS_PER_TOKEN)
+
+
+_handler = None
+
+
+def llm_callbacks() -> list:
+    """
+    LangChain callbacks that time LLM calls (the "llm" stage) and count
+    tokens in and out; pass as ``config={"callbacks": llm_callbacks()}``.
+    Empty when there is nothing to record.
+    """
+    global _handler
+    if not METRICS_ENABLED and _request_timings.get() is None:
+        return []
+    if _handler is None:
+        _handler = _metrics_callback_handler()
+    return [_handler]
+
+
+def _metrics_callback_handler():
+    # Defined lazily so importing this module does not import LangChain
+    from langchain_core.callbacks import BaseCallbackHandler
+
+    class MetricsCallbackHandler(BaseCallbackHandler):
+        def __init__(self):
+            self._runs = {}
+            self._lock = threading.Lock()
+
+        def _start(self, run_id, prompt_text: str):
+            with self._lock:
+                self._runs[run_id] = (time.perf_counter(), _request_timings.get(), _estimate_tokens(prompt_text))
+
+        def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+            self._start(run_id, "".join(prompts))
+
+        def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+            self._start(run_id, "".join(str(m.content) for batch in messages for m in batch))
+
+        def _finish(self, run_id):
+            with self._lock:
+                started = self._runs.pop(run_id, None)
+            if started is None:
+                return None
+            start, timings, prompt_tokens = started
+            elapsed = time.perf_counter() - start
+            if METRICS_ENABLED:
+                STAGE_SECONDS.observe(elapsed, stage="llm")
+            if timings is not None:
+                timings.add("llm", elapsed)
+            return prompt_tokens
+
+        def on_llm_end(self, response, *, run_id, **kwargs):
+            prompt_tokens = self._finish(run_id)
+            if prompt_tokens is None or not METRICS_ENABLED:
+                return
+            usage = (response.llm_output or {}).get("token_usage") or {}
+            if usage:
+                tokens_in, tokens_out = usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+            else:
+                tokens_in = prompt_tokens
+                tokens_out = sum(_estimate_tokens(g.text) for batch in response.generations for g in batch)
+            LLM_TOKENS.inc(tokens_in, direction="in")
+            LLM_TOKENS.inc(tokens_out, direction="out")
+            LLM_CALLS.inc(outcome="ok")
+
+        def on_llm_error(self, error, *, run_id, **kwargs):
+            self._finish(run_id)
+            count(LLM_CALLS, outcome="error")
+
+    return MetricsCallbackHandler()
+
+
+def render_metrics() -> list:
+    """
+    Prometheus text-format lines of every recorded metric.
+    """
+    lines = []
+    for metric in _METRICS:
+        lines += metric.render()
+    return lines
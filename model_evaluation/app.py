@@ -1,14 +1,13 @@
 import os
+import sys
 import pandas as pd
 import streamlit as st
-from google.cloud import bigquery
 from io import BytesIO
 from dotenv import load_dotenv
 import logging
 
 # LangChain & vector store imports
 from langchain_community.document_loaders import DataFrameLoader
-from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_community.vectorstores import FAISS
 from langchain.chains import RetrievalQA
 from langchain_community.chat_models import ChatOpenAI
@@ -22,6 +21,12 @@ from langfuse.decorators import observe
 from langfuse import Langfuse
 import asyncio
 
+# Allow importing shared modules from the repository root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from cache import LRUTTLCache
+from model_registry import registry
+from data_sources import create_data_source
+
 from langchain.prompts import PromptTemplate
 from langchain.chains import RetrievalQA
 from langchain.chains import ConversationalRetrievalChain
@@ -49,43 +54,32 @@ os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = os.getenv('GOOGLE_APPLICATION_CRE
 
 # ---------- BigQuery Data Fetching Functions ----------
 
-def fetch_reviews(asin: str) -> pd.DataFrame:
+@st.cache_resource
+def get_data_source():
     """
-    Fetches product review data for a given ASIN from BigQuery.
-    Adjust the query and table names to match your BigQuery dataset.
+    Returns the data source selected by REVIEW_DATA_SOURCE (BigQuery or a local
+    Parquet snapshot), kept alive across reruns.
     """
-    client = bigquery.Client()
-    query = f"""
-    SELECT *
-    FROM `spheric-engine-451615-a8.Amazon_Reviews_original_dataset_v3.Amazon_dataset_V3`
-    WHERE parent_asin = '{asin}'
+    return create_data_source()
+
+def fetch_reviews(asin: str) -> pd.DataFrame:
     """
-    try:
-        review_df = client.query(query).to_dataframe()
-        logger.info(f"Fetched {len(review_df)} review records for ASIN: {asin}")
-    except Exception as e:
-        logger.exception(f"Error fetching reviews for ASIN {asin}: {e}")
-        review_df = pd.DataFrame()
-    return review_df
+    Fetches product review data for a given ASIN from the configured data source.
+    Table names and projected columns are configured in data_sources.py.
+    """
+    return get_data_source().fetch_reviews(asin)
 
 def fetch_metadata(asin: str) -> pd.DataFrame:
     """
-    Fetches product metadata for a given ASIN from BigQuery.
-    Adjust the query and table names as necessary.
+    Fetches product metadata for a given ASIN from the configured data source.
     """
-    client = bigquery.Client()
-    query = f"""
-    SELECT *
-    FROM `spheric-engine-451615-a8.Amazon_Reviews_original_dataset_v4.meta_data`
-    WHERE parent_asin = '{asin}'
+    return get_data_source().fetch_metadata(asin)
+
+def fetch_review_data(asin: str):
     """
-    try:
-        meta_df = client.query(query).to_dataframe()
-        logger.info(f"Fetched {len(meta_df)} metadata records for ASIN: {asin}")
-    except Exception as e:
-        logger.exception(f"Error fetching metadata for ASIN {asin}: {e}")
-        meta_df = pd.DataFrame()
-    return meta_df
+    Fetches reviews and metadata for an ASIN concurrently; returns (review_df, meta_df).
+    """
+    return get_data_source().fetch_all(asin)
 # ---------- Retriever Creation ----------
 
 def create_retriever_from_df(review_df: pd.DataFrame):
@@ -103,24 +97,29 @@ def create_retriever_from_df(review_df: pd.DataFrame):
         logger.exception("Error loading documents from DataFrame: " + str(e))
         review_docs = []
     
-    # Create embeddings using a HuggingFace model
-    embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
-    # Build the vector store using FAISS
-    vectordb = FAISS.from_documents(documents=review_docs, embedding=embeddings)
+    # Build the vector store using FAISS with the shared, load-once embedding model
+    vectordb = FAISS.from_documents(documents=review_docs, embedding=registry.embeddings)
     retriever = vectordb.as_retriever()
     return retriever
 
-# ---------- Chatbot Chain Setup ----------
+@st.cache_resource
+def get_retriever_cache() -> LRUTTLCache:
+    """
+    Returns the process-wide retriever cache; st.cache_resource keeps it alive across reruns.
+    """
+    return LRUTTLCache(max_entries=int(os.getenv("RETRIEVER_CACHE_SIZE", "32")),
+                       ttl_seconds=float(os.getenv("RETRIEVER_CACHE_TTL_SECONDS", "3600")),
+                       name="retriever")
 
-def create_qa_chain(retriever) -> RetrievalQA:
+def get_retriever(asin: str, review_df: pd.DataFrame):
     """
-    Creates a RetrievalQA chain using an LLM and conversation memory.
+    Returns the cached retriever for an ASIN, building it from review_df on a miss.
     """
-    # Initialize conversation memory to track chat history
-    memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True,output_key="answer")
-    # Initialize the chat LLM (e.g., GPT-4)
-    llm = ChatDeepSeek(model_name="deepseek-chat", temperature=0.5)
-    system_prompt = """You are a highly intelligent assistant for Amazon eCommerce sellers. 
+    return get_retriever_cache().get_or_build(asin, lambda: create_retriever_from_df(review_df))
+
+# ---------- Chatbot Chain Setup ----------
+
+SYSTEM_PROMPT = """You are a highly intelligent assistant for Amazon eCommerce sellers. 
                             Analyze the provided product data and answer seller-related queries. 
                             Just answer concisely.
 
@@ -129,13 +128,39 @@ def create_qa_chain(retriever) -> RetrievalQA:
 
                             Question: {question}
                             """
-    PROMPT = PromptTemplate(template=system_prompt, input_variables=["context", "question"])
+
+@st.cache_resource
+def get_llm():
+    """
+    Returns the shared chat LLM client, created once per Streamlit process.
+    """
+    return ChatDeepSeek(model_name="deepseek-chat", temperature=0.5)
+
+def create_qa_chain(retriever) -> RetrievalQA:
+    """
+    Creates a RetrievalQA chain using an LLM and conversation memory.
+    """
+    # Initialize conversation memory to track chat history
+    memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True,output_key="answer")
+    # Initialize the chat LLM (e.g., GPT-4)
+    llm = get_llm()
+    PROMPT = PromptTemplate(template=SYSTEM_PROMPT, input_variables=["context", "question"])
     # Build a RetrievalQA chain using a simple "stuff" chain type
     qa_chain = ConversationalRetrievalChain.from_llm(llm=llm, retriever=retriever, memory=memory, return_source_documents=True,
         combine_docs_chain_kwargs={'prompt': PROMPT})
     # qa_chain = RetrievalQA.from_chain_type(llm=llm, chain_type="stuff", retriever=retriever, memory=memory, combine_docs_chain_kwargs={"prompt": PROMPT})
     return qa_chain
 
+def stream_answer(retriever, user_question: str):
+    """
+    Retrieves documents for the question and yields LLM tokens as they are generated.
+    """
+    docs = retriever.invoke(user_question)
+    context = "\n\n".join(doc.page_content for doc in docs)
+    for chunk in get_llm().stream(SYSTEM_PROMPT.format(context=context, question=user_question)):
+        if chunk.content:
+            yield chunk.content
+
 # ---------- Streamlit Interface ----------
 
 
@@ -148,9 +173,8 @@ st.subheader("Your Intelligent Seller Companion")
 asin = st.text_input("Enter your product ASIN:", key="asin_input")
 
 if asin:
-    st.info("Fetching data from BigQuery...")
-    review_df = fetch_reviews(asin)
-    meta_df = fetch_metadata(asin)
+    st.info("Fetching review data...")
+    review_df, meta_df = fetch_review_data(asin)
     
     if review_df.empty:
         st.error("No review data found for the provided ASIN.")
@@ -161,8 +185,8 @@ if asin:
 
         
 
-        # Create a retriever from the reviews DataFrame
-        retriever = create_retriever_from_df(review_df)
+        # Look up (or build) the retriever for this ASIN
+        retriever = get_retriever(asin, review_df)
         # Create the QA chain using the retriever
         qa_chain = create_qa_chain(retriever)
 
@@ -170,12 +194,11 @@ if asin:
         user_question = st.text_input("Ask a question about your product:", key="user_question")
         
         if user_question:
-            st.info("Generating answer...")
             try:
-                # Run the chain to generate an answer
-                answer = qa_chain.invoke(user_question)
+                # Render the answer incrementally as the LLM streams tokens
                 st.markdown("**Answer:**")
-                st.write(answer)
+                answer = st.write_stream(stream_answer(retriever, user_question))
+                qa_chain.memory.save_context({"question": user_question}, {"answer": answer})
             except Exception as e:
                 st.error(f"Error generating answer: {e}")
         
@@ -0,0 +1,56 @@
+import os
+import sys
+import time
+from typing import List, Dict
+
+import numpy as np
+
+# Allow importing shared modules from the repository root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from index_factory import build_faiss_index
+
+
+def evaluate_index_recall(test_queries: List[Dict], review_texts: List[str], embeddings, k: int = 5,
+                          kinds=("flat", "hnsw", "ivf"), quantization: str = None):
+    """
+    Measure how closely each approximate index type reproduces exact search.
+
+    Every candidate index is built over the same review vectors and compared with
+    an exact flat index: Recall@k is the share of the exact top-k neighbours the
+    candidate also returns, averaged over the test queries.
+
+    Args:
+        test_queries (List[Dict]): List of test queries (the "query" field is used).
+        review_texts (List[str]): Review texts of the ASIN under test.
+        embeddings: Embedding model used by the chatbot.
+        k (int): Number of top-k neighbours to compare.
+        kinds: Index kinds to evaluate ("flat", "hnsw", "ivf").
+        quantization (str): Optional quantization ("sq8" or "pq") for the candidates.
+
+    Returns:
+        Dict: Recall@k, average search time (ms) and index type per kind.
+    """
+    import faiss
+
+    doc_vectors = np.asarray(embeddings.embed_documents(review_texts), dtype=np.float32)
+    query_vectors = np.asarray([embeddings.embed_query(q["query"]) for q in test_queries], dtype=np.float32)
+    k = min(k, len(doc_vectors))
+
+    exact = faiss.IndexFlatL2(doc_vectors.shape[1])
+    exact.add(doc_vectors)
+    _, exact_ids = exact.search(query_vectors, k)
+
+    results = {}
+    for kind in kinds:
+        index = build_faiss_index(doc_vectors, kind=kind, quantization=quantization)
+        index.add(doc_vectors)
+        start = time.perf_counter()
+        _, ids = index.search(query_vectors, k)
+        elapsed_ms = (time.perf_counter() - start) * 1000 / len(query_vectors)
+        recall = np.mean([len(set(found) & set(expected)) / k for found, expected in zip(ids, exact_ids)])
+        results[kind] = {
+            "Recall@k": float(recall),
+            "Search ms/query": elapsed_ms,
+            "Index": type(index).__name__,
+        }
+    return results
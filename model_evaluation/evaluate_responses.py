@@ -1,46 +1,61 @@
-from nltk.translate.bleu_score import sentence_bleu
-from rouge import Rouge
+from concurrent.futures import ProcessPoolExecutor
 
-def evaluate_responses(test_queries, qa_chain):
-    """
-    Evaluate response quality using BLEU and ROUGE metrics.
-    
-    Args:
-        test_queries (List[Dict]): List of test queries with expected responses.
-        qa_chain: The QA chain object used to generate responses.
-    
-    Returns:
-        Dict: Average BLEU and ROUGE-L scores across all queries.
-    """
-    bleu_scores = []
-    rouge = Rouge()
-    rouge_scores = []
+import numpy as np
 
-    for test_query in test_queries:
-        query = test_query["query"]
-        expected_response = test_query["expected_response"]
+# Below this many responses a process pool costs more than it saves
+MIN_PARALLEL_RESPONSES = 64
 
-        # Generate response using QA chain
-        response = qa_chain.invoke({"question": query})  # Pass "question" as the input key
-        generated_response = response["answer"]  # Extract only the answer
 
-        # Debugging output (optional)
-        print(f"Query: {query}")
-        print(f"Expected Response: {expected_response}")
-        print(f"Generated Response: {generated_response}")
+def score_response(pair):
+    """
+    BLEU and ROUGE-L F1 of one (generated, expected) response pair.
+    """
+    from nltk.translate.bleu_score import sentence_bleu
+    from rouge import Rouge
 
-        # Calculate BLEU score
-        bleu_score = sentence_bleu([expected_response.split()], generated_response.split())
-        bleu_scores.append(bleu_score)
+    generated, expected = pair
+    if not generated.strip() or not expected.strip():
+        return 0.0, 0.0
+    bleu_score = sentence_bleu([expected.split()], generated.split())
+    rouge_score = Rouge().get_scores(generated, expected)[0]["rouge-l"]["f"]
+    return bleu_score, rouge_score
 
-        # Calculate ROUGE scores
-        rouge_score = rouge.get_scores(generated_response, expected_response)
-        rouge_scores.append(rouge_score[0]["rouge-l"]["f"])
 
-    avg_bleu = sum(bleu_scores) / len(bleu_scores)
-    avg_rouge_l = sum(rouge_scores) / len(rouge_scores)
+def score_responses(generated_responses, expected_responses, workers: int = None, chunksize: int = 32):
+    """
+    Average BLEU and ROUGE-L of generated vs. expected responses, scored in a
+    process pool of ``workers`` processes (1 scores in this process).
 
+    Returns:
+        Dict: Average BLEU and ROUGE-L scores and the number of responses scored.
+    """
+    pairs = list(zip(generated_responses, expected_responses))
+    if not pairs:
+        return {"BLEU Score": None, "ROUGE-L Score": None, "responses": 0}
+    if workers == 1 or len(pairs) < MIN_PARALLEL_RESPONSES:
+        scores = [score_response(pair) for pair in pairs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            scores = list(pool.map(score_response, pairs, chunksize=chunksize))
+    bleu_scores, rouge_scores = np.asarray(scores, dtype=np.float64).T
     return {
-        "BLEU Score": avg_bleu,
-        "ROUGE-L Score": avg_rouge_l,
+        "BLEU Score": float(bleu_scores.mean()),
+        "ROUGE-L Score": float(rouge_scores.mean()),
+        "responses": len(pairs),
     }
+
+
+def evaluate_responses(test_queries, qa_chain, workers: int = None):
+    """
+    Evaluate response quality using BLEU and ROUGE metrics.
+
+    Args:
+        test_queries (List[Dict]): List of test queries with expected responses.
+        qa_chain: The QA chain object used to generate responses.
+        workers (int): Scoring processes (see score_responses).
+
+    Returns:
+        Dict: Average BLEU and ROUGE-L scores across all queries.
+    """
+    generated = [qa_chain.invoke({"question": test_query["query"]})["answer"] for test_query in test_queries]
+    return score_responses(generated, [test_query["expected_response"] for test_query in test_queries], workers)
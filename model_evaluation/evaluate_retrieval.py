@@ -1,43 +1,81 @@
 from typing import List, Dict
 
-def evaluate_retrieval(test_queries: List[Dict], retriever, k: int = 5):
+import numpy as np
+
+DEFAULT_KS = (1, 3, 5, 10)
+
+
+def _hit_matrix(ranked_ids, relevant_ids, depth: int) -> np.ndarray:
+    """
+    (queries x depth) matrix: 1 where the retrieved id at that rank is relevant.
+    """
+    hits = np.zeros((len(ranked_ids), depth), dtype=np.float64)
+    for row, (ranked, relevant) in enumerate(zip(ranked_ids, relevant_ids)):
+        for col, doc_id in enumerate(ranked[:depth]):
+            if doc_id in relevant:
+                hits[row, col] = 1.0
+    return hits
+
+
+def retrieval_metrics(ranked_ids: List[List[str]], relevant_ids: List[List[str]], ks=DEFAULT_KS) -> Dict:
     """
-    Evaluate retrieval performance using Precision@k and Recall@k.
-    
+    Precision@k, Recall@k, MRR@k and nDCG@k for every k in ``ks``, computed
+    for all queries at once from review ids.
+
     Args:
-        test_queries (List[Dict]): List of test queries with relevant documents.
-        retriever: The FAISS retriever object.
-        k (int): Number of top-k documents to evaluate.
-        
+        ranked_ids (List[List[str]]): Retrieved review ids per query, best first.
+        relevant_ids (List[List[str]]): Relevant review ids per query; queries
+            without any are left out.
+        ks: Cut-offs to report.
+
+    Returns:
+        Dict: Averages per metric and k, MRR over the deepest cut-off, the
+        mean recall at every k from 1 to max(ks) ("recall_curve") and the
+        number of scored queries.
+    """
+    ks = sorted(set(int(k) for k in ks))
+    depth = ks[-1]
+    relevant_sets = [set(ids) for ids in relevant_ids]
+    num_relevant = np.array([len(ids) for ids in relevant_sets], dtype=np.float64)
+    scored = num_relevant > 0
+    results = {"queries": int(scored.sum())}
+    if not scored.any():
+        return results
+
+    hits = _hit_matrix([ranked for ranked, keep in zip(ranked_ids, scored) if keep],
+                       [ids for ids, keep in zip(relevant_sets, scored) if keep], depth)
+    num_relevant = num_relevant[scored]
+    found = np.cumsum(hits, axis=1)
+    discounts = 1.0 / np.log2(np.arange(2, depth + 2))
+    dcg = np.cumsum(hits * discounts, axis=1)
+    ideal_dcg = np.cumsum(discounts)
+    first_hit = np.where(hits.any(axis=1), hits.argmax(axis=1) + 1, np.inf)
+
+    for k in ks:
+        results[f"precision@{k}"] = float(np.mean(found[:, k - 1] / k))
+        results[f"recall@{k}"] = float(np.mean(found[:, k - 1] / num_relevant))
+        results[f"mrr@{k}"] = float(np.mean(np.where(first_hit <= k, 1.0 / first_hit, 0.0)))
+        ideal = ideal_dcg[np.minimum(num_relevant, k).astype(int) - 1]
+        results[f"ndcg@{k}"] = float(np.mean(dcg[:, k - 1] / ideal))
+    results["mrr"] = results[f"mrr@{depth}"]
+    results["recall_curve"] = np.round(np.mean(found / num_relevant[:, None], axis=0), 4).tolist()
+    return results
+
+
+def evaluate_retrieval(test_queries: List[Dict], retriever, k: int = 5, ks=None):
+    """
+    Evaluate retrieval performance by review id (see retrieval_metrics).
+
+    Args:
+        test_queries (List[Dict]): Test queries with "query" and "relevant_ids"
+            (see utils.normalize_evaluation_entries).
+        retriever: Retriever returning Documents with a "review_id" in their metadata.
+        k (int): Cut-off used when ``ks`` is not given.
+        ks: Cut-offs to report.
+
     Returns:
-        Dict: Average Precision@k and Recall@k across all queries.
+        Dict: Retrieval metrics averaged across all queries.
     """
-    precision_scores = []
-    recall_scores = []
-
-    for test_query in test_queries:
-        query = test_query["query"]
-        relevant_docs = test_query["retrieved_docs"]
-
-        # Retrieve top-k documents
-        retrieved_docs = retriever.invoke(query)[:k]
-        retrieved_texts = [doc.page_content for doc in retrieved_docs]
-        print(f"Query: {query}")
-        print(f"Relevant Docs: {relevant_docs}")
-        print(f"Retrieved Docs: {retrieved_texts}")
-
-        # Calculate Precision@k
-        precision_at_k = len(set(relevant_docs) & set(retrieved_texts)) / len(retrieved_texts)
-        precision_scores.append(precision_at_k)
-
-        # Calculate Recall@k
-        recall_at_k = len(set(relevant_docs) & set(retrieved_texts)) / len(relevant_docs)
-        recall_scores.append(recall_at_k)
-
-    avg_precision = sum(precision_scores) / len(precision_scores)
-    avg_recall = sum(recall_scores) / len(recall_scores)
-
-    return {
-        "Precision@k": avg_precision,
-        "Recall@k": avg_recall,
-    }
+    ranked_ids = [[doc.metadata.get("review_id") for doc in retriever.invoke(test_query["query"])]
+                  for test_query in test_queries]
+    return retrieval_metrics(ranked_ids, [test_query["relevant_ids"] for test_query in test_queries], ks or (k,))
@@ -0,0 +1,119 @@
+import os
+import sys
+import time
+import asyncio
+import logging
+
+# Allow importing shared modules from the repository root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from evaluate_retrieval import retrieval_metrics, DEFAULT_KS
+from evaluate_responses import score_responses
+
+logger = logging.getLogger(__name__)
+
+
+async def _evaluate_asin(asin: str, entries, depth: int, semaphore: asyncio.Semaphore, responses=None):
+    """
+    Runs the chatbot's retrieval (and, with ``responses``, the LLM) for every
+    entry of one ASIN; returns one result dict per entry.
+    """
+    # The app modules are imported here so that loading this module stays cheap
+    import chatbot_model
+    from model_registry import registry
+    from hybrid_retrieval import rerank_documents, pack_documents
+
+    try:
+        index = await chatbot_model.aget_asin_index(asin)
+    except Exception as e:
+        logger.error(f"Index build failed for ASIN {asin}: {e}")
+        return [{**entry, "error": f"index build failed: {e}"} for entry in entries]
+    if index is None:
+        logger.warning(f"No reviews found for ASIN: {asin}")
+        return [{**entry, "error": "no reviews"} for entry in entries]
+    retriever = index.retriever
+    loop = asyncio.get_running_loop()
+    # One batched embedding call for all of the ASIN's queries
+    vectors = await loop.run_in_executor(chatbot_model.cpu_executor, registry.embed_queries,
+                                         [entry["query"] for entry in entries])
+
+    def rank(query: str, vector):
+        # Same ranking as HybridRetriever.retrieve, but keeping ``depth`` ranked ids
+        scored = rerank_documents(query, retriever.candidates(query, vector))
+        context = pack_documents([doc for doc, _ in scored[:retriever.top_k]], retriever.max_tokens)
+        return [doc.metadata.get("review_id") for doc, _ in scored[:depth]], context
+
+    async def evaluate_one(entry, vector):
+        async with semaphore:
+            start = time.perf_counter()
+            result = dict(entry)
+            try:
+                result["retrieved_ids"], context = await loop.run_in_executor(
+                    chatbot_model.cpu_executor, rank, entry["query"], vector)
+                if responses is not None and entry.get("expected_response"):
+                    result["response"] = await responses.ainvoke(
+                        registry.llm, chatbot_model.build_prompt(context, entry["query"]))
+            except Exception as e:
+                logger.error(f"Evaluation query failed for ASIN {asin}: {e}")
+                result["error"] = str(e)
+            result["seconds"] = round(time.perf_counter() - start, 4)
+            return result
+
+    return await asyncio.gather(*(evaluate_one(entry, vector) for entry, vector in zip(entries, vectors)))
+
+
+async def run_queries(entries, depth: int, concurrency: int = 16, asin_concurrency: int = 4, responses=None):
+    """
+    Evaluates all entries concurrently: at most ``asin_concurrency`` ASIN
+    indexes are loaded at a time and at most ``concurrency`` queries are in
+    flight. Results come back in the order of ``entries``.
+    """
+    by_asin = {}
+    for position, entry in enumerate(entries):
+        by_asin.setdefault(entry["asin"], []).append((position, entry))
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    asin_semaphore = asyncio.Semaphore(max(1, asin_concurrency))
+
+    async def evaluate_group(asin, group):
+        async with asin_semaphore:
+            results = await _evaluate_asin(asin, [entry for _, entry in group], depth, semaphore, responses)
+        return [(position, result) for (position, _), result in zip(group, results)]
+
+    groups = await asyncio.gather(*(evaluate_group(asin, group) for asin, group in by_asin.items()))
+    return [result for _, result in sorted((pair for group in groups for pair in group), key=lambda pair: pair[0])]
+
+
+def evaluate(entries, ks=DEFAULT_KS, concurrency: int = 16, asin_concurrency: int = 4, responses=None,
+             score_workers: int = None):
+    """
+    Scores the chatbot on normalized dataset entries
+    (see utils.normalize_evaluation_entries).
+
+    Retrieval is scored by review id with retrieval_metrics at every k in
+    ``ks``. With ``responses`` (a RecordedResponses) answers are generated
+    for entries with an expected response and scored with BLEU / ROUGE-L in
+    a process pool.
+
+    Returns:
+        (Dict, List[Dict]): The report and the per-query results.
+    """
+    start = time.perf_counter()
+    results = asyncio.run(run_queries(entries, max(ks), concurrency, asin_concurrency, responses))
+    query_seconds = time.perf_counter() - start
+
+    retrieved = [result for result in results if "retrieved_ids" in result]
+    report = {
+        "queries": len(results),
+        "asins": len({result["asin"] for result in results}),
+        "errors": sum("error" in result for result in results),
+        "query_seconds": round(query_seconds, 3),
+        "retrieval": retrieval_metrics([result["retrieved_ids"] for result in retrieved],
+                                       [result["relevant_ids"] for result in retrieved], ks),
+    }
+    answered = [result for result in retrieved if "response" in result]
+    if answered:
+        report["responses"] = score_responses([result["response"] for result in answered],
+                                              [result["expected_response"] for result in answered], score_workers)
+    if responses is not None:
+        report["llm"] = responses.stats()
+    report["total_seconds"] = round(time.perf_counter() - start, 3)
+    return report, results
@@ -0,0 +1,76 @@
+import os
+import json
+import hashlib
+import asyncio
+import threading
+
+RESPONSE_MODES = ("record", "replay", "off")
+
+
+class RecordedResponses:
+    """
+    Records LLM responses to a JSONL file and replays them on later runs, so
+    re-running an evaluation does not call (or pay for) the LLM again.
+
+    Responses are keyed by the model name and the full prompt, so any change
+    to the retrieved context or the prompt template is a new call.
+
+    Modes:
+        "record": replay recorded responses, call the LLM for new prompts and record them.
+        "replay": only replay; a prompt without a recorded response is an error.
+        "off": always call the LLM and record nothing.
+    """
+
+    def __init__(self, path: str, mode: str = "record"):
+        if mode not in RESPONSE_MODES:
+            raise ValueError(f"Unknown response mode: {mode!r} (expected one of {RESPONSE_MODES})")
+        self.path = path
+        self.mode = mode
+        self.hits = 0
+        self.calls = 0
+        self._responses = {}
+        self._lock = threading.Lock()
+        if mode != "off" and os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    if line.strip():
+                        record = json.loads(line)
+                        self._responses[record["key"]] = record["response"]
+
+    @staticmethod
+    def key(model_name: str, prompt: str) -> str:
+        return hashlib.sha256(f"{model_name}\x00{prompt}".encode("utf-8")).hexdigest()
+
+    def _record(self, key: str, model_name: str, response: str):
+        with self._lock:
+            self._responses[key] = response
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, "a") as f:
+                f.write(json.dumps({"key": key, "model": model_name, "response": response}) + "\n")
+
+    async def ainvoke(self, llm, prompt: str, config=None) -> str:
+        """
+        Answer of ``llm`` for ``prompt``, replayed when it was recorded before.
+        Concurrent identical prompts may both reach the LLM; the last one recorded wins.
+        """
+        model_name = getattr(llm, "model_name", None) or type(llm).__name__
+        key = self.key(model_name, prompt)
+        if self.mode != "off":
+            with self._lock:
+                response = self._responses.get(key)
+            if response is not None:
+                self.hits += 1
+                return response
+            if self.mode == "replay":
+                raise KeyError(f"No recorded response for prompt {key[:12]} (model {model_name})")
+        self.calls += 1
+        response = (await llm.ainvoke(prompt, config=config)).content
+        if self.mode == "record":
+            # File appends are blocking; keep them off the event loop
+            await asyncio.to_thread(self._record, key, model_name, response)
+        return response
+
+    def stats(self) -> dict:
+        return {"mode": self.mode, "replayed": self.hits, "llm_calls": self.calls, "recorded": len(self._responses)}
@@ -1,18 +1,83 @@
-from utils import load_evaluation_dataset
-from evaluate_retrieval import evaluate_retrieval
-from evaluate_responses import evaluate_responses
-from app import create_qa_chain
-from app import create_retriever_from_df
-from app import fetch_metadata
-from app import fetch_reviews
-asin = "B07LFV749P"
-dataset = load_evaluation_dataset("evaluation_framework/evaluation_dataset.json")
-review_df = fetch_reviews(asin)
-meta_df = fetch_metadata(asin)
-retriever = create_retriever_from_df(review_df)
-qa_chain = create_qa_chain(retriever)
-retriever_results = evaluate_retrieval(dataset, retriever)
-print("Retrieval Performance:", retriever_results)
-
-response_results = evaluate_responses(dataset, qa_chain)
-print("Response Quality:", response_results)
+"""
+Evaluation CLI: scores the chatbot's retrieval (Precision/Recall/MRR/nDCG at
+several k, by review id) and, unless --no-responses, its answers (BLEU /
+ROUGE-L) on an evaluation dataset spanning any number of ASINs.
+
+LLM answers are recorded to --responses and replayed on later runs, so
+re-running an evaluation only calls the LLM for prompts it has not seen.
+
+Example:
+    python model_evaluation/run.py --dataset model_evaluation/evaluation_dataset.json \
+        --k 1 3 5 10 20 --concurrency 16 --out eval_report.json
+"""
+import os
+import json
+import argparse
+import logging
+
+from utils import load_evaluation_dataset, normalize_evaluation_entries
+from evaluate_retrieval import DEFAULT_KS
+from response_cache import RecordedResponses, RESPONSE_MODES
+from evaluation_runner import evaluate
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# chatbot_model copies these into os.environ at import time, which fails when they are unset
+_PROVIDER_ENV_VARS = ["HF_TOKEN", "DEEPSEEK_API_KEY", "GROQ_API_KEY", "LANGFUSE_PUBLIC_KEY", "LANGFUSE_SECRET_KEY",
+                      "LANGFUSE_HOST", "GOOGLE_APPLICATION_CREDENTIALS"]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Evaluate chatbot retrieval and answers on a labelled dataset.")
+    parser.add_argument("--dataset", default=os.path.join(HERE, "evaluation_dataset.json"),
+                        help="JSON list of {asin, query, relevant_ids, expected_response} entries.")
+    parser.add_argument("--asin", default="B07LFV749P", help="ASIN for entries that do not name one.")
+    parser.add_argument("--k", type=int, nargs="+", default=list(DEFAULT_KS), help="Cut-offs to report.")
+    parser.add_argument("--concurrency", type=int, default=16, help="Queries in flight.")
+    parser.add_argument("--asin-concurrency", type=int, default=4, help="ASIN indexes loaded at a time.")
+    parser.add_argument("--no-responses", action="store_true", help="Only evaluate retrieval.")
+    parser.add_argument("--responses", default=os.path.join(HERE, "recorded_responses.jsonl"),
+                        help="JSONL file LLM responses are recorded to and replayed from.")
+    parser.add_argument("--response-mode", choices=RESPONSE_MODES, default="record",
+                        help="record: replay known prompts and record new ones; replay: never call the LLM; "
+                             "off: always call the LLM.")
+    parser.add_argument("--score-workers", type=int, help="Processes for BLEU/ROUGE scoring (default: all CPUs).")
+    parser.add_argument("--index-recall", action="store_true",
+                        help="Also report HNSW/IVF Recall@k against exact search on the first ASIN.")
+    parser.add_argument("--details", help="Write per-query results to this JSONL file.")
+    parser.add_argument("--out", help="Write the report to this JSON file.")
+    args = parser.parse_args(argv)
+
+    for name in _PROVIDER_ENV_VARS:
+        os.environ.setdefault(name, "")
+    logging.basicConfig(level=logging.INFO)
+
+    entries = normalize_evaluation_entries(load_evaluation_dataset(args.dataset), default_asin=args.asin)
+    responses = None if args.no_responses else RecordedResponses(args.responses, args.response_mode)
+    report, results = evaluate(entries, ks=args.k, concurrency=args.concurrency,
+                               asin_concurrency=args.asin_concurrency, responses=responses,
+                               score_workers=args.score_workers)
+
+    if args.index_recall and entries:
+        from chatbot_model import fetch_reviews
+        from model_registry import registry
+        from evaluate_index import evaluate_index_recall
+
+        asin = entries[0]["asin"]
+        review_df = fetch_reviews(asin)
+        report["index_recall"] = evaluate_index_recall(
+            [entry for entry in entries if entry["asin"] == asin],
+            review_df["text"].dropna().astype(str).tolist(), registry.embeddings, k=max(args.k))
+
+    if args.details:
+        with open(args.details, "w") as f:
+            for result in results:
+                f.write(json.dumps(result, default=str) + "\n")
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,75 @@
+import os
+import re
+import sys
 import json
 
+# Allow importing shared modules from the repository root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from data_sources import review_id_for
+
+# Fields of a serialized Document(metadata={...}) that identify the review
+_DOCUMENT_REPR = re.compile(r"Document\(metadata=\{(.*?)\}, page_content=")
+_METADATA_FIELD = r"'{name}': '?([^',}}]*)'?"
+
+
 def load_evaluation_dataset(file_path):
     """
     Load the evaluation dataset from a JSON file.
-    
+
     Args:
         file_path (str): Path to the JSON file containing the dataset.
-        
+
     Returns:
         List[Dict]: List of evaluation queries and expected results.
     """
     with open(file_path, "r") as f:
         return json.load(f)
+
+
+def _metadata_field(metadata: str, name: str):
+    match = re.search(_METADATA_FIELD.format(name=name), metadata)
+    return match.group(1) if match else None
+
+
+def review_ids_from_documents(serialized_docs):
+    """
+    Stable review ids of serialized ``Document(...)`` reprs, derived from
+    their user_id, asin and timestamp metadata like data_sources.REVIEW_ID_SQL.
+
+    Returns:
+        (List[str], str): The review ids and the parent ASIN of the first document.
+    """
+    review_ids, parent_asin = [], None
+    for text in serialized_docs:
+        for metadata in _DOCUMENT_REPR.findall(text):
+            user_id, asin = _metadata_field(metadata, "user_id"), _metadata_field(metadata, "asin")
+            timestamp = _metadata_field(metadata, "timestamp")
+            if user_id and asin and timestamp:
+                review_ids.append(review_id_for(user_id, asin, int(timestamp)))
+            parent_asin = parent_asin or _metadata_field(metadata, "parent_asin")
+    return list(dict.fromkeys(review_ids)), parent_asin
+
+
+def normalize_evaluation_entries(entries, default_asin: str = None):
+    """
+    Brings dataset entries to the form the evaluation runner scores:
+    ``{"asin", "query", "relevant_ids", "expected_response"}``.
+
+    Entries may already carry ``relevant_ids`` (review ids) and ``asin``;
+    older entries listing ``retrieved_docs`` as serialized Documents get
+    their ids derived from the documents' metadata. Entries without an ASIN
+    use ``default_asin``.
+    """
+    normalized = []
+    for entry in entries:
+        relevant_ids, asin = entry.get("relevant_ids"), entry.get("asin")
+        if relevant_ids is None:
+            relevant_ids, doc_asin = review_ids_from_documents(entry.get("retrieved_docs", []))
+            asin = asin or doc_asin
+        normalized.append({
+            "asin": asin or default_asin,
+            "query": entry["query"],
+            "relevant_ids": list(relevant_ids),
+            "expected_response": entry.get("expected_response"),
+        })
+    return normalized
@@ -0,0 +1,179 @@
+import os
+import threading
+import logging
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "all-MiniLM-L6-v2")
+LLM_MODEL_NAME = os.getenv("LLM_MODEL_NAME", "gpt-3.5-turbo")
+LLM_TEMPERATURE = float(os.getenv("LLM_TEMPERATURE", "0.5"))
+# Small CPU cross-encoder that reranks retrieved reviews; set to an empty string to disable
+RERANKER_MODEL_NAME = os.getenv("RERANKER_MODEL_NAME", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+# Persistent cache of document embeddings; set to an empty string to disable
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", os.path.join("/tmp", "chatbot_embedding_cache"))
+EMBEDDING_CACHE_DTYPE = os.getenv("EMBEDDING_CACHE_DTYPE", "float16")
+
+
+def _locked_embeddings(inner, lock, cache=None):
+    """
+    Wraps a LangChain Embeddings object so concurrent callers share one model
+    instance without running inference on it at the same time. With a
+    ``cache``, documents embedded before are served from it instead; queries
+    never go through (or into) the cache.
+    """
+    # Imported here so that importing this module stays cheap
+    from langchain_core.embeddings import Embeddings
+
+    def embed_with_model(texts):
+        with lock:
+            return inner.embed_documents(texts)
+
+    class LockedEmbeddings(Embeddings):
+        def embed_documents(self, texts):
+            if cache is not None:
+                return cache.embed_documents(texts, embed_with_model)
+            return embed_with_model(texts)
+
+        def embed_query(self, text):
+            with lock:
+                return inner.embed_query(text)
+
+        def embed_queries(self, texts):
+            # One batched model call; questions are not worth persisting
+            return embed_with_model(texts)
+
+    return LockedEmbeddings()
+
+
+class ModelRegistry:
+    """
+    Process-wide holder for the embedding model, the reranker and the chat
+    LLM client.
+
+    All are created on first use (or by warm_up()) and then shared by every
+    request. Heavy libraries are only imported when a model is first loaded.
+    """
+
+    def __init__(self, embedding_model_name: str = EMBEDDING_MODEL_NAME,
+                 llm_model_name: str = LLM_MODEL_NAME, temperature: float = LLM_TEMPERATURE,
+                 embedding_cache_dir: str = EMBEDDING_CACHE_DIR,
+                 reranker_model_name: str = RERANKER_MODEL_NAME):
+        self.embedding_model_name = embedding_model_name
+        self.reranker_model_name = reranker_model_name
+        self.embedding_cache = None
+        if embedding_cache_dir:
+            from embedding_cache import EmbeddingCache
+            self.embedding_cache = EmbeddingCache(embedding_cache_dir, embedding_model_name,
+                                                  dtype=EMBEDDING_CACHE_DTYPE)
+        self.llm_model_name = llm_model_name
+        self.temperature = temperature
+        self._load_lock = threading.Lock()
+        self._embed_lock = threading.Lock()
+        self._rerank_lock = threading.Lock()
+        self._embeddings = None
+        self._reranker = None
+        self._llm = None
+        self._ready = threading.Event()
+        self.warm_up_error = None
+
+    @property
+    def embeddings(self):
+        """
+        Thread-safe LangChain Embeddings backed by the shared model.
+        """
+        if self._embeddings is None:
+            with self._load_lock:
+                if self._embeddings is None:
+                    from langchain_huggingface import HuggingFaceEmbeddings
+                    logger.info(f"Loading embedding model: {self.embedding_model_name}")
+                    inner = HuggingFaceEmbeddings(model_name=self.embedding_model_name)
+                    self._embeddings = _locked_embeddings(inner, self._embed_lock, self.embedding_cache)
+        return self._embeddings
+
+    @property
+    def reranker(self):
+        """
+        Shared cross-encoder for reranking, or None when disabled.
+        """
+        if self._reranker is None and self.reranker_model_name:
+            with self._load_lock:
+                if self._reranker is None:
+                    from sentence_transformers import CrossEncoder
+                    logger.info(f"Loading reranker model: {self.reranker_model_name}")
+                    self._reranker = CrossEncoder(self.reranker_model_name, device="cpu")
+        return self._reranker
+
+    @property
+    def llm(self):
+        """
+        Shared chat model client.
+        """
+        if self._llm is None:
+            with self._load_lock:
+                if self._llm is None:
+                    from langchain_community.chat_models import ChatOpenAI
+                    logger.info(f"Creating LLM client: {self.llm_model_name}")
+                    self._llm = ChatOpenAI(model_name=self.llm_model_name, temperature=self.temperature)
+        return self._llm
+
+    def use_models(self, embeddings=None, llm=None):
+        """
+        Installs ready-made models (e.g. fakes for benchmarks) instead of
+        loading the configured ones. Embeddings get the same locking and
+        document cache as the default model.
+        """
+        with self._load_lock:
+            if embeddings is not None:
+                self._embeddings = _locked_embeddings(embeddings, self._embed_lock, self.embedding_cache)
+            if llm is not None:
+                self._llm = llm
+
+    def embed_documents(self, texts):
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text):
+        return self.embeddings.embed_query(text)
+
+    def embed_queries(self, texts):
+        """
+        Embeds many questions in one batch, bypassing the document embedding cache.
+        """
+        return self.embeddings.embed_queries(texts)
+
+    def rerank(self, query, texts):
+        """
+        Relevance score of each text for ``query`` (higher is better), or None
+        when no reranker is configured.
+        """
+        reranker = self.reranker
+        if reranker is None:
+            return None
+        with self._rerank_lock:
+            return reranker.predict([(query, text) for text in texts]).tolist()
+
+    def warm_up(self):
+        """
+        Loads the models and runs one embedding so the first request does not
+        pay the model load. Errors are recorded instead of raised so a failed
+        warm-up leaves the process serving (and loading lazily) as before.
+        """
+        try:
+            self.embed_query("warm-up")
+            self.rerank("warm-up", ["warm-up"])
+            _ = self.llm
+            logger.info("Model warm-up complete.")
+        except Exception as e:
+            self.warm_up_error = str(e)
+            logger.exception(f"Model warm-up failed: {e}")
+        finally:
+            self._ready.set()
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set() and self.warm_up_error is None
+
+
+registry = ModelRegistry()
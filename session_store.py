@@ -0,0 +1,80 @@
+import os
+import asyncio
+import logging
+
+from cache import LRUTTLCache
+
+logger = logging.getLogger(__name__)
+
+SESSION_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", "1000"))
+SESSION_IDLE_TTL_SECONDS = float(os.getenv("SESSION_IDLE_TTL_SECONDS", "1800"))
+# Recent turns are kept verbatim up to this many tokens; older turns are folded
+# into a running summary so the prompt stops growing
+SESSION_MAX_TOKENS = int(os.getenv("SESSION_MAX_TOKENS", "1000"))
+
+
+class ChatSession:
+    """
+    Conversation state for one (session_id, ASIN) pair: the QA chain, whose
+    memory holds the history, and a lock that serializes turns so concurrent
+    requests on one session cannot interleave their memory updates.
+    """
+
+    def __init__(self, chain):
+        self.chain = chain
+        self.lock = asyncio.Lock()
+
+    @property
+    def memory(self):
+        return self.chain.memory
+
+
+class SessionStore:
+    """
+    Server-side chat sessions keyed by (session_id, ASIN).
+
+    Sessions idle for longer than ``idle_ttl_seconds`` are dropped, and at most
+    ``max_sessions`` are kept (least recently used evicted first). Together
+    with the per-session token budget this caps the memory used for history.
+    """
+
+    def __init__(self, max_sessions: int = SESSION_MAX_SESSIONS,
+                 idle_ttl_seconds: float = SESSION_IDLE_TTL_SECONDS,
+                 max_token_limit: int = SESSION_MAX_TOKENS):
+        self.max_token_limit = max_token_limit
+        self._sessions = LRUTTLCache(max_entries=max_sessions, ttl_seconds=idle_ttl_seconds,
+                                     name="sessions", refresh_on_access=True)
+
+    def create_memory(self, llm):
+        """
+        Bounded conversation memory: a verbatim window of recent turns plus a
+        rolling LLM-written summary of everything older.
+        """
+        from langchain.memory import ConversationSummaryBufferMemory
+        return ConversationSummaryBufferMemory(llm=llm, max_token_limit=self.max_token_limit,
+                                               memory_key="chat_history", return_messages=True,
+                                               input_key="question", output_key="answer")
+
+    def get_session(self, session_id: str, asin: str, retriever, chain_factory) -> ChatSession:
+        """
+        Returns the session for (session_id, asin), creating its chain with
+        ``chain_factory(retriever)`` on first use. An existing chain is pointed
+        at ``retriever`` so it always searches the current index.
+        """
+        key = (session_id, asin)
+        session = self._sessions.get(key)
+        if session is None:
+            session = ChatSession(chain_factory(retriever))
+            self._sessions.put(key, session)
+            logger.info(f"Started chat session {session_id} for ASIN: {asin}")
+        elif session.chain.retriever is not retriever:
+            session.chain.retriever = retriever
+        return session
+
+    def end_session(self, session_id: str, asin: str) -> bool:
+        return self._sessions.invalidate((session_id, asin))
+
+    def stats(self) -> dict:
+        stats = self._sessions.stats()
+        stats["max_token_limit"] = self.max_token_limit
+        return stats
@@ -0,0 +1,126 @@
+import asyncio
+import threading
+import contextvars
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key into one execution.
+
+    The first caller for a key (the leader) runs the function; callers that
+    arrive while it is running wait for the same result instead of running it
+    again. Sync callers (threads) and async callers share one in-flight call
+    per key. Results and exceptions are delivered to every waiter, and the
+    key is released as soon as the call finishes, so a failure is never
+    remembered: the next caller simply starts a new call.
+
+    Args:
+        name (str): Label used in the stats output.
+    """
+
+    def __init__(self, name: str = "single_flight"):
+        self.name = name
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._tasks = set()
+        self.leaders = 0
+        self.coalesced = 0
+        self.failures = 0
+
+    def _join(self, key):
+        """
+        Returns (future, is_leader) for ``key``, registering a new call if none is in flight.
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future, False
+            future = Future()
+            self._calls[key] = future
+            self.leaders += 1
+            return future, True
+
+    def _run(self, key, future: Future, fn):
+        try:
+            result = fn()
+        except BaseException as e:
+            self._fail(key, future, e)
+        else:
+            with self._lock:
+                self._calls.pop(key, None)
+            future.set_result(result)
+
+    def do(self, key, fn):
+        """
+        Calls ``fn()`` unless a call for ``key`` is already in flight, in which
+        case its result is awaited (blocking) and returned instead.
+        """
+        future, leader = self._join(key)
+        if leader:
+            self._run(key, future, fn)
+        return future.result()
+
+    async def ado(self, key, fn, executor=None, admission=None):
+        """
+        Async variant of do(): the leader runs the blocking ``fn`` on
+        ``executor``; every caller awaits the shared result without blocking
+        the event loop. Cancelling one waiter does not cancel the call.
+
+        With ``admission`` (an async context manager factory, e.g.
+        StageQueue.slot), the call is started only once it is admitted and
+        holds the admission until it finishes; a refusal (e.g. a full queue)
+        is delivered to every waiter like any other failure.
+        """
+        future, leader = self._join(key)
+        if leader:
+            # The leader's context goes along, e.g. for its request timing breakdown and deadline
+            if admission is None:
+                self._start(key, future, fn, executor)
+            else:
+                task = asyncio.ensure_future(self._admit_and_run(key, future, fn, executor, admission))
+                # The event loop only keeps weak references to tasks
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+        return await asyncio.shield(asyncio.wrap_future(future))
+
+    def _start(self, key, future: Future, fn, executor):
+        try:
+            return asyncio.get_running_loop().run_in_executor(
+                executor, contextvars.copy_context().run, self._run, key, future, fn)
+        except Exception as e:
+            # e.g. the executor is shut down; release the key for later callers
+            self._fail(key, future, e)
+
+    async def _admit_and_run(self, key, future: Future, fn, executor, admission):
+        try:
+            async with admission():
+                running = self._start(key, future, fn, executor)
+                if running is not None:
+                    await running
+        except BaseException as e:
+            if not future.done():
+                self._fail(key, future, e)
+            if not isinstance(e, Exception):
+                raise
+
+    def _fail(self, key, future: Future, error: BaseException):
+        with self._lock:
+            self._calls.pop(key, None)
+            self.failures += 1
+        future.set_exception(error)
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "name": self.name,
+                "in_flight": len(self._calls),
+                "leaders": self.leaders,
+                "coalesced": self.coalesced,
+                "failures": self.failures,
+            }
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The app modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# No cross-encoder download in tests; reranking falls back to the fused order
+os.environ.setdefault("RERANKER_MODEL_NAME", "")
@@ -0,0 +1,50 @@
+import pytest
+
+from aggregates import detect_intent
+
+
+@pytest.mark.parametrize("question, intent", [
+    ("How many reviews does this product have?", "review_count"),
+    ("What is the total reviews count?", "review_count"),
+    ("What's the average rating?", "average_rating"),
+    ("What is my rating?", "average_rating"),
+    ("What is the overall star rating?", "average_rating"),
+    ("Show me the rating distribution", "rating_distribution"),
+    ("How many 5-star reviews are there?", "rating_distribution"),
+    ("How has the rating changed over time?", "rating_trend"),
+    ("Monthly trend of reviews", "rating_trend"),
+    ("How many helpful votes did the reviews get?", "helpful_votes"),
+    ("What is the total number of helpful votes?", "helpful_votes"),
+    ("How many reviews are from verified purchases?", "verified_share"),
+    ("How many verified buyers reviewed it?", "verified_share"),
+    ("What percentage of reviews are verified?", "verified_share"),
+    ("What share of reviewers are verified buyers?", "verified_share"),
+    ("% of verified purchases", "verified_share"),
+    ("Are most reviews verified, in percent?", "verified_share"),
+    ("What is the verified purchase share?", "verified_share"),
+])
+def test_aggregate_questions_are_routed_to_the_fast_path(question, intent):
+    assert detect_intent(question) == intent
+
+
+@pytest.mark.parametrize("question", [
+    "How many reviews mention shipping problems?",
+    "How many 1-star reviews mention broken parts?",
+    "Overall, why do customers give low star ratings?",
+    "Summarize the reviews with the most helpful votes",
+    "Which review has the most helpful votes?",
+    "How many reviews complain about the smell?",
+    "What is the average rating of reviews that talk about durability?",
+    "What's the overall feeling about the zipper?",
+    "What do verified buyers say about the battery?",
+    "Do verified purchasers complain about shipping?",
+    "Summarize the verified reviews",
+    "Do verified buyers share any complaints about the fit?",
+    "Is the battery life good?",
+    "What do people like most about it?",
+    "Did anyone find the reviews helpful for sizing?",
+    "Which stars of the show appear on the box art?",
+    "How does it compare to the previous model?",
+])
+def test_qualitative_questions_need_retrieval(question):
+    assert detect_intent(question) is None
@@ -0,0 +1,134 @@
+import threading
+
+import pandas as pd
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from asin_index import AsinIndex
+
+ASIN = "B000TEST00"
+
+
+def _review(i: int) -> dict:
+    return {"review_id": f"r{i}", "timestamp": i, "text": f"review {i} about the battery and the screen",
+            "rating": 1 + i % 5}
+
+
+class _ChangingSource:
+    """
+    Review source whose reviews change between refreshes: each step adds new
+    reviews and drops a few old ones.
+    """
+
+    def __init__(self, reviews):
+        self.reviews = list(reviews)
+
+    def step(self, next_id: int, added: int = 5, removed: int = 2):
+        self.reviews = self.reviews[removed:] + [_review(i) for i in range(next_id, next_id + added)]
+
+    def fetch_review_keys(self, asin: str) -> pd.DataFrame:
+        return pd.DataFrame(self.reviews)[["review_id", "timestamp"]]
+
+    def fetch_reviews(self, asin: str, since: int = None) -> pd.DataFrame:
+        review_df = pd.DataFrame(self.reviews)
+        return review_df if since is None else review_df[review_df["timestamp"] > since]
+
+
+def _build(reviews, kind="flat"):
+    docs = [Document(page_content=review["text"], metadata=review) for review in reviews]
+    return AsinIndex.build(ASIN, docs, DeterministicFakeEmbedding(size=32), kind=kind)
+
+
+def test_refresh_returns_new_index_and_leaves_original_untouched():
+    reviews = [_review(i) for i in range(50)]
+    index = _build(reviews)
+    source = _ChangingSource(reviews)
+    source.step(50)
+
+    refreshed = index.refresh(source)
+
+    assert refreshed is not None and refreshed is not index
+    assert index.review_ids == {f"r{i}" for i in range(50)}
+    assert index.delta is None and not index.tombstones
+    assert refreshed.review_ids == {f"r{i}" for i in range(2, 55)}
+    assert refreshed.high_water_mark == 54
+
+
+def test_refresh_applies_only_the_delta():
+    reviews = [_review(i) for i in range(50)]
+    index = _build(reviews)
+    source = _ChangingSource(reviews)
+    source.step(50)
+
+    refreshed = index.refresh(source)
+
+    # The base store is shared, not copied; additions go to the delta
+    assert refreshed.vectordb is index.vectordb
+    assert refreshed.vectordb.index.ntotal == 50
+    assert refreshed.delta.index.ntotal == 5
+    assert refreshed.tombstones == {"r0", "r1"}
+    ids = {doc.metadata["review_id"] for doc, _ in refreshed.retriever.candidates("review 52 about the battery")}
+    assert "r52" in ids and not ids & {"r0", "r1"}
+
+    # Removing a review of the delta deletes it there instead of tombstoning it
+    source.reviews = [review for review in source.reviews if review["review_id"] != "r52"]
+    again = refreshed.refresh(source)
+    assert again.delta.index.ntotal == 4 and "r52" not in again.tombstones
+    assert "r52" not in again.review_ids
+
+
+def test_refresh_compacts_past_the_threshold():
+    reviews = [_review(i) for i in range(50)]
+    index = _build(reviews)
+    source = _ChangingSource(reviews)
+    source.step(50, added=10, removed=5)
+
+    refreshed = index.refresh(source)
+
+    assert refreshed.vectordb is not index.vectordb
+    assert refreshed.delta is None and not refreshed.tombstones
+    assert refreshed.vectordb.index.ntotal == 55
+    assert refreshed.review_ids == {review["review_id"] for review in source.reviews}
+
+
+def test_refresh_without_changes_returns_none():
+    reviews = [_review(i) for i in range(20)]
+    assert _build(reviews).refresh(_ChangingSource(reviews)) is None
+
+
+def test_refresh_alongside_reads():
+    reviews = [_review(i) for i in range(200)]
+    source = _ChangingSource(reviews)
+    current = {"index": _build(reviews)}
+    errors = []
+    done = threading.Event()
+
+    def read():
+        while not done.is_set():
+            index = current["index"]
+            try:
+                docs = index.retriever.retrieve("battery screen")
+                assert docs and all(isinstance(doc.page_content, str) for doc in docs)
+            except Exception as e:  # noqa: BLE001 - collect for the assertion below
+                errors.append(e)
+                return
+
+    readers = [threading.Thread(target=read) for _ in range(4)]
+    for reader in readers:
+        reader.start()
+    try:
+        next_id = 200
+        for _ in range(25):
+            source.step(next_id)
+            next_id += 5
+            refreshed = current["index"].refresh(source)
+            assert refreshed is not None
+            # Swap as _load_asin_index does via retriever_cache
+            current["index"] = refreshed
+    finally:
+        done.set()
+        for reader in readers:
+            reader.join()
+
+    assert not errors, errors
+    assert current["index"].review_ids == {review["review_id"] for review in source.reviews}
@@ -0,0 +1,33 @@
+import os
+
+import numpy as np
+
+from embedding_cache import EmbeddingCache
+
+
+def _embed(texts):
+    return [[float(len(text)), float(sum(map(ord, text)))] for text in texts]
+
+
+def _fail(texts):
+    raise AssertionError(f"unexpected embedding call for {texts}")
+
+
+def test_incomplete_append_does_not_shift_later_rows(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), "model", dtype="float32")
+    cache.embed_documents(["a", "bb"], _embed)
+
+    # A worker died after writing its vector row but before writing its key
+    with open(os.path.join(cache.dir, "vectors.bin"), "ab") as f:
+        f.write(np.ones(2, dtype=np.float32).tobytes())
+    EmbeddingCache(str(tmp_path), "model", dtype="float32").embed_documents(["ccc"], _embed)
+    # ... and one died in the middle of writing a key
+    with open(os.path.join(cache.dir, "keys.bin"), "ab") as f:
+        f.write(b"torn")
+    EmbeddingCache(str(tmp_path), "model", dtype="float32").embed_documents(["dddd"], _embed)
+
+    texts = ["a", "bb", "ccc", "dddd"]
+    reopened = EmbeddingCache(str(tmp_path), "model", dtype="float32")
+    assert reopened.embed_documents(texts, _fail) == _embed(texts)
+    assert os.path.getsize(os.path.join(cache.dir, "keys.bin")) == 4 * 16
+    assert os.path.getsize(os.path.join(cache.dir, "vectors.bin")) == 4 * 2 * 4